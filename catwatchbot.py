@@ -4,13 +4,19 @@ from datetime import datetime, timedelta, timezone
 import os
 import re
 import sys
+import glob
+import json
 import time
 import locale
 import argparse
-import urllib.parse
+import queue
+import threading
 import sqlite3
 import logging
 import logging.handlers
+import fcntl
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -19,41 +25,62 @@ load_dotenv()
 os.environ['PYWIKIBOT_DIR'] = os.path.dirname(os.path.abspath(__file__))
 
 import pywikibot
+import requests
 
-parser = argparse.ArgumentParser(description='CatWatchBot')
-parser.add_argument('--simulate', action='store_true', help='Do not write results to wiki')
-parser.add_argument('--verbose', action='store_true', help='Output debug output')
-parser.add_argument('--backfill', action='store_true',
-                    help='Backfill missing cleanlog dates for seeded pages (slow, run once)')
-args = parser.parse_args()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WIKIS_DIR = os.path.join(BASE_DIR, 'wikis')
+
+# Timestamps in the runs table and in API requests
+API_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+USER_AGENT = 'CatWatchBot2.0 (https://github.com/DiFronzo/CatWatchBot2.0)'
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter('[%(asctime)s %(levelname)s] %(message)s')
 
-# Only add SMTP handler if mail settings are configured
-mail_from = os.getenv('MAIL_FROM')
-mail_to = os.getenv('MAIL_TO')
-if mail_from and mail_to:
-    try:
-        smtp_handler = logging.handlers.SMTPHandler(
-            mailhost=('localhost', 25),
-            fromaddr=mail_from,
-            toaddrs=[mail_to],
-            subject="[toolserver] CatWatchBot crashed!"
-        )
-        smtp_handler.setLevel(logging.ERROR)
-        logger.addHandler(smtp_handler)
-    except Exception:
-        pass
 
-console_handler = logging.StreamHandler()
-if args.verbose:
-    console_handler.setLevel(logging.DEBUG)
-else:
-    console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+def setup_logging(verbose=False):
+    """Attach the console (and optional SMTP) handlers to the root logger."""
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('[%(asctime)s %(levelname)s] %(message)s')
+
+    # Only add SMTP handler if mail settings are configured
+    mail_from = os.getenv('MAIL_FROM')
+    mail_to = os.getenv('MAIL_TO')
+    if mail_from and mail_to:
+        try:
+            smtp_handler = logging.handlers.SMTPHandler(
+                mailhost=('localhost', 25),
+                fromaddr=mail_from,
+                toaddrs=[mail_to],
+                subject="[toolserver] CatWatchBot crashed!"
+            )
+            smtp_handler.setLevel(logging.ERROR)
+            logger.addHandler(smtp_handler)
+        except Exception:
+            pass
+
+    console_handler = logging.StreamHandler()
+    if verbose:
+        console_handler.setLevel(logging.DEBUG)
+    else:
+        console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
+
+
+def set_log_prefix(prefix):
+    """Tag every log line with the wiki being processed."""
+    formatter = logging.Formatter('[%(asctime)s %(levelname)s] [' + prefix + '] %(message)s')
+    for handler in logger.handlers:
+        handler.setFormatter(formatter)
+
+
+def setup_locale():
+    for loc in ['no_NO', 'nb_NO.utf8']:
+        try:
+            locale.setlocale(locale.LC_ALL, loc)
+        except locale.Error:
+            logger.warning('Locale %s not found' % loc)
+
 
 SIMULATE_OUTPUT_DIR = 'simulate_output'
 
@@ -61,9 +88,10 @@ SIMULATE_OUTPUT_DIR = 'simulate_output'
 def save_or_dump(page_title, text, site=None, summary='', dryrun=False):
     """Save to wiki or dump to local .txt file when simulating."""
     if dryrun:
-        os.makedirs(SIMULATE_OUTPUT_DIR, exist_ok=True)
+        outdir = SIMULATE_OUTPUT_DIR if site is None else os.path.join(SIMULATE_OUTPUT_DIR, site.dbName())
+        os.makedirs(outdir, exist_ok=True)
         safe_name = page_title.replace('/', '_').replace(':', '_').replace(' ', '_')
-        filepath = os.path.join(SIMULATE_OUTPUT_DIR, safe_name + '.txt')
+        filepath = os.path.join(outdir, safe_name + '.txt')
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write('=== Page: %s ===\n\n' % page_title)
             f.write(text)
@@ -74,67 +102,753 @@ def save_or_dump(page_title, text, site=None, summary='', dryrun=False):
         page.save(summary=summary)
 
 
-cats = {
-    'opprydning': {
-        'categories': ['Opprydning-statistikk', 'Viktig opprydning'],
-        'templates': ['opprydning', 'opprydningfordi', 'opprydding', 'viktig opprydning', 'opprydning-viktig']
-    },
-    'oppdatering': {
-        'categories': ['Trenger oppdatering'],
-        'templates': ['trenger oppdatering', 'best før']
-    },
-    'interwiki': {
-        'categories': ['Mangler interwiki'],
-        'templates': ['mangler interwiki']
-    },
-    'flytting': {
-        'categories': ['Artikler som bør flyttes'],
-        'templates': ['flytting', 'flytt']
-    },
-    'fletting': {
-        'categories': ['Artikler som bør flettes'],
-        'templates': ['fletting', 'flett fra', 'flett-fra', 'flett til', 'flett-til', 'flett']
-    },
-    'språkvask': {
-        'categories': ['Artikler som trenger språkvask'],
-        'templates': ['språkvask', 'dårlig språk', 'språkrøkt']
-    },
-    'kilder': {
-        'categories': ['Artikler uten referanser', 'Artikler som trenger referanser', 'Artikler uten kilder'],
-        'templates': ['referanseløs', 'trenger referanse', 'tr', 'referanse', 'citation needed', 'cn', 'fact', 'kildeløs', 'refforbedreavsnitt']
-    },
-    'ukategorisert': {
-        'categories': ['Ukategorisert'],
-        'templates': ['ukategorisert', 'mangler kategori', 'ukat']
-    }
-}
+def load_config(path):
+    """Load a per-wiki configuration file (see wikis/no.json)."""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    config.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    config.setdefault('family', 'wikipedia')
+    config.setdefault('lang', config['name'])
+    config.setdefault('db', 'vedlikehold-%s.db' % config['name'])
+    config.setdefault('api_delay', 1.0)
+    config.setdefault('api_endpoint', None)
+    # Seconds to wait for a write lock held by another connection to the database
+    config.setdefault('db_timeout', 60)
+    # Number of categories enumerated at the same time in the daily run
+    config.setdefault('enumeration_workers', 4)
+    config.setdefault('category_prefix', 'Category:')
+    config.setdefault('special_pages', {})
+    config.setdefault('miniticker', {'fikset': [], 'merket': []})
+    # Icons and verbs for ticker entries, by action and category key
+    config.setdefault('ticker', {})
+    for key in ['icons', 'category_icons', 'verbs']:
+        config['ticker'].setdefault(key, {})
+    # Documentation shown on the yearly statistics templates, with the
+    # placeholders %(year)s, %(cats)s and %(templatename)s
+    config.setdefault('stats_doc', '')
+    config.setdefault('retention', None)
+    # Also store the member count of each category in catstats
+    config.setdefault('category_stats', False)
+    config.setdefault('stream', {})
+    config['stream'].setdefault('url', 'https://stream.wikimedia.org/v2/stream/recentchange')
+    # Seconds to collect edits before looking up their categories
+    config['stream'].setdefault('check_interval', 30)
+    # Seconds without changes before republishing, and the longest delay
+    config['stream'].setdefault('debounce', 300)
+    config['stream'].setdefault('max_delay', 1800)
+    config.setdefault('queue', {})
+    # Seconds since the start of the daily run, and page checks done, after
+    # which the remaining queued page checks are left for the next run
+    config['queue'].setdefault('time_budget', 3600)
+    config['queue'].setdefault('check_budget', 5000)
+    # Seconds before a failed page check is retried, doubled for every
+    # failure. A check that is being done is also claimed for this long
+    config['queue'].setdefault('retry_delay', 900)
+    config['queue'].setdefault('max_retry_delay', 86400)
+    if not os.path.isabs(config['db']):
+        config['db'] = os.path.join(BASE_DIR, config['db'])
+    if config['retention']:
+        config['retention'].setdefault('archive_db', os.path.splitext(config['db'])[0] + '-archive.db')
+        # 0 releases all free pages
+        config['retention'].setdefault('vacuum_pages', 0)
+        if not os.path.isabs(config['retention']['archive_db']):
+            config['retention']['archive_db'] = os.path.join(BASE_DIR, config['retention']['archive_db'])
+    for key in ['pages', 'cats']:
+        if key not in config:
+            raise ValueError('%s: missing required key "%s"' % (path, key))
+    for k in config['cats']:
+        # Only count members in these namespaces, e.g. [0] for articles only. Default: all
+        config['cats'][k].setdefault('namespaces', None)
+    return config
+
+
+def find_configs(names=None):
+    """Return config file paths for the given wiki names, or all configured wikis."""
+    if names:
+        return [os.path.join(WIKIS_DIR, '%s.json' % name) for name in names]
+    return sorted(glob.glob(os.path.join(WIKIS_DIR, '*.json')))
+
+
+# Tables that referred to pages by title before the pages table was introduced
+LEGACY_TABLES = ['catmembers', 'catlog', 'cleanlog']
+
+
+def connect_db(config, api=None):
+    """Open the wiki's database and make sure the schema is in place.
+
+    Databases that still store page titles in catmembers, catlog and cleanlog
+    are migrated to page IDs, which requires an MwApi to look the IDs up.
+    """
+    sql = sqlite3.connect(config['db'], timeout=config['db_timeout'])
+
+    # The *_legacy tables are left behind if an earlier migration was interrupted
+    legacy = 'page' in [row[1] for row in sql.execute('PRAGMA table_info(catmembers)')]
+    resume = sql.execute('SELECT 1 FROM sqlite_master WHERE name="catmembers_legacy"').fetchone() is not None
+    if legacy or resume:
+        if api is None:
+            raise RuntimeError('%s stores page titles instead of page IDs and must be migrated '
+                               'by a normal run of the bot first' % config['db'])
+    if legacy:
+        for table in LEGACY_TABLES:
+            sql.execute('ALTER TABLE %s RENAME TO %s_legacy' % (table, table))
+
+    # Auto-create tables if they don't exist
+    schema_file = os.path.join(BASE_DIR, 'vedlikehold.sql')
+    if os.path.exists(schema_file):
+        with open(schema_file) as f:
+            sql.executescript(f.read())
+        logger.debug('Database schema ensured')
+
+    if legacy or resume:
+        migrate_page_ids(sql, api)
+    if 'id' not in [row[1] for row in sql.execute('PRAGMA table_info(catlog)')]:
+        migrate_catlog_ids(sql)
+
+    # Tags are derived from cleanlog, so fill the table for existing databases
+    if sql.execute('SELECT 1 FROM tags LIMIT 1').fetchone() is None \
+            and sql.execute('SELECT 1 FROM cleanlog LIMIT 1').fetchone() is not None:
+        rebuild_tags(sql, config)
+    if sql.execute('SELECT 1 FROM monthtotals LIMIT 1').fetchone() is None \
+            and sql.execute('SELECT 1 FROM cleanlog LIMIT 1').fetchone() is not None:
+        rebuild_rollups(sql, config)
+
+    # The stats table has one column per category key, so wikis
+    # tracking other keys than the default ones get them added here
+    columns = [row[1] for row in sql.execute('PRAGMA table_info(stats)')]
+    for k in config['cats']:
+        if k not in columns:
+            sql.execute('ALTER TABLE stats ADD COLUMN "%s" INTEGER NOT NULL DEFAULT 0' % k)
+            logger.info('Added stats column for %s' % k)
+    sql.commit()
+    return sql
+
+
+def migrate_page_ids(sql, api):
+    """Move the rows of the *_legacy tables into the page ID based tables.
+
+    Titles are resolved to page IDs in batches. Pages that no longer exist
+    are given negative surrogate IDs so their history is kept.
+    """
+    titles = [row[0] for row in sql.execute(
+        'SELECT page FROM catmembers_legacy UNION SELECT page FROM catlog_legacy '
+        'UNION SELECT page FROM cleanlog_legacy')]
+    logger.info('Migrating %d page titles to page IDs' % len(titles))
+    ids = api.page_ids(titles)
+
+    surrogate = sql.execute('SELECT MIN(0, IFNULL(MIN(id), 0)) FROM pages').fetchone()[0]
+    pagemap = []
+    for title in titles:
+        if title not in ids:
+            surrogate -= 1
+            ids[title] = surrogate
+        pagemap.append((title, ids[title]))
+    logger.info('    %d titles resolved, %d missing pages got surrogate IDs' % (
+        len(titles) - len([p for p in pagemap if p[1] < 0]), len([p for p in pagemap if p[1] < 0])))
+
+    cur = sql.cursor()
+    cur.execute('CREATE TEMP TABLE pagemap (title TEXT PRIMARY KEY, id INTEGER NOT NULL)')
+    cur.executemany('INSERT INTO pagemap (title, id) VALUES (?,?)', pagemap)
+    cur.execute('INSERT OR IGNORE INTO pages (id, title) SELECT id, title FROM pagemap')
+    cur.execute('''INSERT OR IGNORE INTO catmembers (date, category, page_id)
+        SELECT l.date, l.category, m.id FROM catmembers_legacy l JOIN pagemap m ON m.title = l.page''')
+    cur.execute('''INSERT INTO catlog (date, category, page_id, added, new)
+        SELECT l.date, l.category, m.id, l.added, l.new FROM catlog_legacy l JOIN pagemap m ON m.title = l.page
+        ORDER BY l.rowid''')
+    cur.execute('''INSERT INTO cleanlog (id, date, category, action, page_id, user, revision)
+        SELECT l.id, l.date, l.category, l.action, m.id, l.user, l.revision
+        FROM cleanlog_legacy l JOIN pagemap m ON m.title = l.page''')
+    for table in LEGACY_TABLES:
+        cur.execute('DROP TABLE %s_legacy' % table)
+    cur.execute('DROP TABLE temp.pagemap')
+    sql.commit()
+    cur.close()
+    logger.info('Page ID migration complete')
+
+
+def migrate_catlog_ids(sql):
+    """Give catlog rows a stable id, like cleanlog has.
+
+    catlog used to be keyed by its rowid, which SQLite hands out again once
+    archiving has emptied the table. Rows keep their rowid as id, so exports
+    keyed on it carry on where they stopped.
+    """
+    logger.info('Adding ids to catlog')
+    sql.commit()
+    cur = sql.cursor()
+    cur.execute('BEGIN')
+    cur.execute('ALTER TABLE catlog RENAME TO catlog_noid')
+    cur.execute('''CREATE TABLE catlog (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date DATETIME NOT NULL,
+        category TEXT NOT NULL,
+        page_id INTEGER NOT NULL REFERENCES pages (id),
+        added INTEGER NOT NULL,
+        new INTEGER NOT NULL
+    )''')
+    cur.execute('''INSERT INTO catlog (id, date, category, page_id, added, new)
+        SELECT rowid, date, category, page_id, added, new FROM catlog_noid ORDER BY rowid''')
+    cur.execute('DROP TABLE catlog_noid')
+    sql.commit()
+    cur.close()
+
+
+def chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class MwApi:
+    """Minimal MediaWiki API client for batched queries.
+
+    Requests go through pywikibot, so login and maxlag handling apply, unless
+    an endpoint URL is given. That is used to point the bot at a local
+    stand-in for the API (see dev/fakewiki.py).
+    """
+
+    # Maximum number of titles/IDs per query for accounts with the apihighlimits right
+    batch_size = 500
+
+    def __init__(self, site, limiter, endpoint=None):
+        self.site = site
+        self.limiter = limiter
+        self.endpoint = endpoint
+        if endpoint:
+            self.session = requests.Session()
+
+    def request(self, wait=True, **params):
+        """Send one API request. With wait=False the request does not wait
+        for the rate limiter, and is only throttled by pywikibot."""
+        params['formatversion'] = 2
+        for k, v in params.items():
+            if isinstance(v, (list, tuple, set)):
+                params[k] = '|'.join(str(x) for x in v)
+
+        if wait:
+            self.limiter.wait()
+        if not self.endpoint:
+            return self.site.simple_request(**params).submit()
+
+        params['format'] = 'json'
+        response = self.session.get(self.endpoint, params=params, timeout=60)
+        response.raise_for_status()
+        data = response.json()
+        if 'error' in data:
+            raise pywikibot.exceptions.APIError(data['error'].get('code'), data['error'].get('info'))
+        return data
+
+    def query(self, wait=True, **params):
+        """Yield the "query" part of each response, following continuation."""
+        params['action'] = 'query'
+        cont = {}
+        while True:
+            data = self.request(wait, **dict(params, **cont))
+            if 'query' in data:
+                yield data['query']
+            if 'continue' not in data:
+                break
+            cont = data['continue']
+
+    def page_ids(self, titles):
+        """Map titles to page IDs. Missing pages are left out."""
+        ids = {}
+        for batch in chunks(titles, self.batch_size):
+            for result in self.query(titles=batch):
+                normalized = {n['to']: n['from'] for n in result.get('normalized', [])}
+                for page in result.get('pages', []):
+                    if 'pageid' in page and not page.get('missing'):
+                        ids[normalized.get(page['title'], page['title'])] = page['pageid']
+        return ids
+
+    def categories(self, titles, categories):
+        """Return {title: (page ID, namespace, set of categories)} for existing
+        pages, only listing the categories among `categories` (full titles)."""
+        found = {}
+        for batch in chunks(titles, 50):
+            for result in self.query(titles=batch, prop='categories', clcategories=categories, cllimit='max'):
+                normalized = {n['to']: n['from'] for n in result.get('normalized', [])}
+                for page in result.get('pages', []):
+                    if 'pageid' not in page or page.get('missing'):
+                        continue
+                    title = normalized.get(page['title'], page['title'])
+                    entry = found.setdefault(title, (page['pageid'], page['ns'], set()))
+                    entry[2].update(c['title'] for c in page.get('categories', []))
+        return found
+
+    def page_info(self, page_ids):
+        """Return {page ID: page} with the prop=info fields ("missing",
+        "redirect", "lastrevid", …) of the given pages."""
+        info = {}
+        for batch in chunks(page_ids, self.batch_size):
+            for result in self.query(pageids=batch, prop='info'):
+                for page in result.get('pages', []):
+                    info[page['pageid']] = page
+        return info
+
+    def category_members(self, title, namespaces=None):
+        """Yield (page ID, title) for the members of a category (full title),
+        optionally only those in the given namespaces. Only IDs and titles
+        are requested, in batches as large as the API allows.
+
+        These read-only requests skip the rate limiter, like pywikibot's own
+        category.members() did, and are left to pywikibot's throttle and
+        maxlag handling. Otherwise every continuation would wait api_delay,
+        and categories enumerated at the same time would take turns."""
+        params = {'list': 'categorymembers', 'cmtitle': title, 'cmprop': 'ids|title', 'cmlimit': 'max'}
+        if namespaces is not None:
+            params['cmnamespace'] = namespaces
+        for result in self.query(wait=False, **params):
+            for member in result.get('categorymembers', []):
+                yield member['pageid'], member['title']
+
+    def moves(self, start, end):
+        """Return (timestamp, old title, new title) for all page moves between
+        two API timestamps, oldest first."""
+        moves = []
+        for result in self.query(list='logevents', letype='move', lestart=start, leend=end,
+                                 ledir='newer', leprop='title|details|timestamp', lelimit='max'):
+            for event in result.get('logevents', []):
+                if 'params' in event and 'target_title' in event['params']:
+                    moves.append((event['timestamp'], event['title'], event['params']['target_title']))
+        return moves
+
+    def new_pages(self, start, end):
+        """Return {page ID: API timestamp} for the pages created between two
+        API timestamps, from the recent changes."""
+        created = {}
+        for result in self.query(list='recentchanges', rctype='new', rcstart=start, rcend=end,
+                                 rcdir='newer', rcprop='ids|timestamp', rclimit='max'):
+            for change in result.get('recentchanges', []):
+                created[change['pageid']] = change['timestamp']
+        return created
+
+
+class MoveLog:
+    """Page moves since the previous run, fetched in one batched query on first use."""
+
+    def __init__(self, api, since):
+        self.api = api
+        self.since = since
+        self._targets = None
+
+    def renamed_to(self, title):
+        """Return the title a page ended up at after one or more moves, or None."""
+        if self._targets is None:
+            until = datetime.now(timezone.utc).strftime(API_TIME_FORMAT)
+            self._targets = {}
+            for ts, old, new in self.api.moves(self.since, until):
+                self._targets[old] = new
+            logger.info('    Found %d page moves since %s' % (len(self._targets), self.since))
+
+        seen = set()
+        while title in self._targets and title not in seen:
+            seen.add(title)
+            title = self._targets[title]
+        return title if seen else None
+
+
+class NewPages:
+    """Pages created within the last 7 days, fetched from the recent changes
+    in batched queries on first use, instead of one revision lookup per page.
+
+    Later lookups only fetch the pages created since the previous fetch, if
+    that was more than `refresh` seconds ago, so the daemon can keep one.
+    """
+
+    days = 7
+
+    def __init__(self, api, refresh=60):
+        self.api = api
+        self.refresh = refresh
+        self._created = None
+        self._until = None
+        self._fetched = None
+
+    def is_new(self, page_id):
+        """Return 1 if the page was created within the last 7 days, otherwise 0."""
+        now = datetime.now(timezone.utc)
+        if self._created is None or time.monotonic() - self._fetched >= self.refresh:
+            until = now.strftime(API_TIME_FORMAT)
+            if self._created is None:
+                self._created = {}
+                self._until = (now - timedelta(days=self.days)).strftime(API_TIME_FORMAT)
+            self._created.update(self.api.new_pages(self._until, until))
+            self._until = until
+            self._fetched = time.monotonic()
+            logger.debug('    %d pages created in the last %d days' % (len(self._created), self.days))
+        created = self._created.get(page_id)
+        return int(created is not None and created > (now - timedelta(days=self.days)).strftime(API_TIME_FORMAT))
+
+
+def store_titles(cur, titles):
+    """Insert new pages and update the titles of renamed ones."""
+    cur.executemany('''INSERT INTO pages (id, title) VALUES (?,?)
+        ON CONFLICT (id) DO UPDATE SET title=excluded.title WHERE title != excluded.title''', titles)
+
+
+def record_removal(cur, date, cat_title, page_id):
+    cur.execute('INSERT INTO catlog (date,category,page_id,added,new) VALUES (?,?,?,0,0)',
+                (date, cat_title, page_id))
+    cur.execute('DELETE FROM catmembers WHERE category=? AND page_id=?',
+                (cat_title, page_id))
+
+
+def record_addition(cur, date, cat_title, page_id, isnew):
+    cur.execute('INSERT INTO catmembers (date,category,page_id) VALUES (?,?,?)',
+                (date, cat_title, page_id))
+    cur.execute('INSERT INTO catlog (date,category,page_id,added,new) VALUES (?,?,?,1,?)',
+                (date, cat_title, page_id, isnew))
+
+
+def log_cleanup(cur, date, catkey, action, page_id, user, revision):
+    """Insert a cleanlog row and update the tagging interval it belongs to."""
+    cur.execute('''INSERT INTO cleanlog (date, category, action, page_id, user, revision)
+        VALUES(?,?,?,?,?,?)''', (date, catkey, action, page_id, user, revision))
+    update_tags(cur, date, catkey, action, page_id, user, revision)
+    update_rollups(cur, date, catkey, action, user)
+
+
+def queue_check(cur, page_id, catkey, action, since=None):
+    """Queue a page check, to be done by StatBot.process_queue.
+
+    If the same check is already queued, the oldest `since` is kept, and
+    None (check all revisions) wins.
+    """
+    now = datetime.now(timezone.utc).strftime(API_TIME_FORMAT)
+    cur.execute('INSERT INTO pagequeue (page_id,category,action,since,queued,next_attempt) VALUES (?,?,?,?,?,?) '
+                'ON CONFLICT (page_id, category, action) DO UPDATE SET '
+                'since=CASE WHEN since IS NULL OR excluded.since IS NULL THEN NULL '
+                'ELSE MIN(since, excluded.since) END, next_attempt=MIN(next_attempt, excluded.next_attempt)',
+                (page_id, catkey, action, since, now, now))
+
+
+def update_rollups(cur, date, catkey, action, user, count=1):
+    """Add a cleanlog event to the per-user and per-month totals."""
+    month = date[:7]
+    cur.execute('''INSERT INTO usermonth (month, category, action, user, count) VALUES (?,?,?,?,?)
+        ON CONFLICT (month, category, action, user) DO UPDATE SET count = count + excluded.count''',
+                (month, catkey, action, user, count))
+    cur.execute('''INSERT INTO monthtotals (month, category, action, count) VALUES (?,?,?,?)
+        ON CONFLICT (month, category, action) DO UPDATE SET count = count + excluded.count''',
+                (month, catkey, action, count))
+
+
+def rebuild_rollups(sql, config):
+    """Rebuild usermonth and monthtotals from cleanlog, including archived rows."""
+    logger.info('Rebuilding user and month rollups from cleanlog')
+    source = 'cleanlog'
+    if config['retention'] and os.path.exists(config['retention']['archive_db']):
+        attach_archive(sql, config)
+        source = 'cleanlog_all'
+    cur = sql.cursor()
+    try:
+        cur.execute('DELETE FROM usermonth')
+        cur.execute('DELETE FROM monthtotals')
+        rows = cur.execute('SELECT substr(date, 1, 7), category, action, user, COUNT(*) FROM %s '
+                           'GROUP BY substr(date, 1, 7), category, action, user' % source).fetchall()
+        for month, catkey, action, user, count in rows:
+            update_rollups(cur, month, catkey, action, user, count)
+        sql.commit()
+    finally:
+        cur.close()
+        if source == 'cleanlog_all':
+            detach_archive(sql)
+    logger.info('    %d user/month rows rebuilt' % len(rows))
+
+
+def update_tags(cur, date, catkey, action, page_id, user, revision):
+    """Apply a cleanlog event to the tags table.
+
+    A merket event opens an interval, or moves the tagging time of the open
+    one forward. A fikset event closes the open interval, or is stored as an
+    interval of its own when the tagging was never seen.
+
+    Events can arrive out of order, e.g. when a failed page check is retried
+    after later events for the page were logged. Then the intervals from the
+    one the event belongs to onwards are rebuilt from cleanlog, in revision order.
+    """
+    latest = cur.execute('SELECT MAX(MAX(COALESCE(tagged_revision, 0), COALESCE(fixed_revision, 0))) FROM tags '
+                         'WHERE page_id=? AND category=?', (page_id, catkey)).fetchone()[0]
+    if latest is None or revision > latest:
+        _apply_tag_event(cur, date, catkey, action, page_id, user, revision)
+        return
+
+    # Intervals that were closed before the event are not affected by it
+    closed = cur.execute('SELECT COALESCE(MAX(fixed_revision), -1) FROM tags WHERE page_id=? AND category=? '
+                         'AND fixed_revision < ?', (page_id, catkey, revision)).fetchone()[0]
+    cur.execute('DELETE FROM tags WHERE page_id=? AND category=? AND (fixed_revision IS NULL OR fixed_revision > ?)',
+                (page_id, catkey, closed))
+    for row in cur.execute('SELECT date, category, action, page_id, user, revision FROM cleanlog '
+                           'WHERE page_id=? AND category=? AND revision > ? ORDER BY revision, id',
+                           (page_id, catkey, closed)).fetchall():
+        _apply_tag_event(cur, *row)
+
+
+def _apply_tag_event(cur, date, catkey, action, page_id, user, revision):
+    row = cur.execute('SELECT id, tagged FROM tags WHERE page_id=? AND category=? AND fixed IS NULL '
+                      'ORDER BY id DESC LIMIT 1', (page_id, catkey)).fetchone()
+    if action == 'merket':
+        if row is None:
+            cur.execute('''INSERT INTO tags (page_id, category, tagged, tagged_revision, tagged_user)
+                VALUES(?,?,?,?,?)''', (page_id, catkey, date, revision, user))
+        elif row[1] is None or date > row[1]:
+            cur.execute('UPDATE tags SET tagged=?, tagged_revision=?, tagged_user=? WHERE id=?',
+                        (date, revision, user, row[0]))
+    elif row is not None and (row[1] is None or date >= row[1]):
+        cur.execute('''UPDATE tags SET fixed=?, fixed_revision=?, fixed_user=?,
+            fix_days=julianday(?) - julianday(tagged) WHERE id=?''', (date, revision, user, date, row[0]))
+    else:
+        cur.execute('''INSERT INTO tags (page_id, category, fixed, fixed_revision, fixed_user)
+            VALUES(?,?,?,?,?)''', (page_id, catkey, date, revision, user))
+
+
+def rebuild_tags(sql, config):
+    """Rebuild the tags table by replaying cleanlog, including archived rows."""
+    logger.info('Rebuilding tags from cleanlog')
+    source = 'cleanlog'
+    if config['retention'] and os.path.exists(config['retention']['archive_db']):
+        sql.commit()
+        attach_archive(sql, config)
+        source = 'cleanlog_all'
+    cur = sql.cursor()
+    try:
+        cur.execute('DELETE FROM tags')
+        # Each page's events in revision order, so no event is out of order
+        rows = cur.execute('SELECT date, category, action, page_id, user, revision FROM %s '
+                           'ORDER BY page_id, category, revision, id' % source).fetchall()
+        for row in rows:
+            _apply_tag_event(cur, *row)
+        sql.commit()
+    finally:
+        cur.close()
+        if source == 'cleanlog_all':
+            detach_archive(sql)
+    logger.info('    %d cleanlog rows replayed' % len(rows))
+
+
+def tag_stats(sql, catkey):
+    """Return (median age in days of open tags, median days to fix) for a category key."""
+    cur = sql.cursor()
+    result = []
+    for count_query, median_query in [
+            ('SELECT COUNT(*) FROM tags WHERE category=? AND fixed IS NULL AND tagged IS NOT NULL',
+             'SELECT julianday("now") - julianday(tagged) FROM tags WHERE category=? AND fixed IS NULL '
+             'AND tagged IS NOT NULL ORDER BY tagged DESC LIMIT 1 OFFSET ?'),
+            ('SELECT COUNT(*) FROM tags WHERE category=? AND fix_days IS NOT NULL',
+             'SELECT fix_days FROM tags WHERE category=? AND fix_days IS NOT NULL ORDER BY fix_days LIMIT 1 OFFSET ?')]:
+        count = cur.execute(count_query, (catkey,)).fetchone()[0]
+        if count == 0:
+            result.append(None)
+        else:
+            result.append(cur.execute(median_query, (catkey, count // 2)).fetchone()[0])
+    cur.close()
+    return tuple(result)
+
+
+def stats_snapshot(sql, config, date=None):
+    """Count the members of each category key, and of each category, in
+    catmembers. A page in several categories of one key is counted once.
+
+    With a date (YYYY-MM-DD), the members at the end of that day are
+    reconstructed from catlog instead, including the archived rows if the
+    archive is attached. Returns ({key: pages}, {category: pages}).
+    """
+    pairs = [(catname, k) for k in config['cats'] for catname in config['cats'][k]['categories']]
+    params = [x for pair in pairs for x in pair]
+    if date is None:
+        members = 'SELECT category, page_id FROM catmembers'
+    else:
+        source = 'catlog'
+        if sql.execute('SELECT 1 FROM sqlite_temp_master WHERE name="catlog_all"').fetchone():
+            source = 'catlog_all'
+        # A page is a member if its latest catlog row up to that day is an
+        # addition. Rows from the same day are ordered by insertion
+        members = ('SELECT category, page_id FROM ('
+                   '  SELECT category, page_id, added, ROW_NUMBER() OVER ('
+                   '    PARTITION BY category, page_id ORDER BY date DESC, id DESC) AS n'
+                   '  FROM %s WHERE date <= ?) WHERE n = 1 AND added = 1' % source)
+        params.append(date)
+    with_clause = 'WITH keys (category, key) AS (VALUES %s), members AS (%s) ' % (
+        ','.join('(?,?)' for _ in pairs), members)
+
+    cur = sql.cursor()
+    counts = {k: 0 for k in config['cats']}
+    for k, count in cur.execute(
+            with_clause + 'SELECT keys.key, COUNT(DISTINCT members.page_id) FROM members '
+            'JOIN keys ON keys.category = members.category GROUP BY keys.key', params):
+        counts[k] = count
+    categories = {}
+    if config['category_stats']:
+        categories = {catname: 0 for catname, k in pairs}
+        for catname, count in cur.execute(
+                with_clause + 'SELECT category, COUNT(*) FROM members '
+                'WHERE category IN (SELECT category FROM keys) GROUP BY category', params):
+            categories[catname] = count
+    cur.close()
+    return counts, categories
+
+
+def store_stats(cur, date, narticles, counts, categories):
+    """Insert a stats row for the date, and the per-category counts into catstats."""
+    # The schema has NOT NULL columns for the nowiki keys, which other wikis
+    # may not track, so every key column without a count gets 0
+    counts = dict(counts)
+    for row in cur.execute('PRAGMA table_info(stats)').fetchall():
+        if row[1] not in ('date', 'articlecount'):
+            counts.setdefault(row[1], 0)
+    keys = list(counts)
+    data = [date, narticles] + [counts[k] for k in keys]
+    cur.execute('INSERT INTO stats (date,articlecount,%s) VALUES(%s)' % (
+        ','.join('"%s"' % k for k in keys), ','.join('?' for _ in data)), data)
+    for catname, count in categories.items():
+        cur.execute('INSERT INTO catstats (date,category,count) VALUES (?,?,?) '
+                    'ON CONFLICT (date, category) DO UPDATE SET count=excluded.count',
+                    (date, catname, count))
+
+
+def recompute_stats(sql, config, date):
+    """Recompute the stats for a past day (YYYY-MM-DD) from catlog, without
+    using the API. Existing stats rows for that day are updated. Otherwise a
+    row is added with the article count of the closest earlier day.
+
+    catlog only covers a category from the day the bot started watching it.
+    Keys with a category that catlog does not cover on that day keep their
+    stored count. Raises ValueError if no key is covered, or if a missing
+    row would need counts for keys that are not.
+    """
+    archive = config['retention'] and os.path.exists(config['retention']['archive_db'])
+    if archive:
+        attach_archive(sql, config)
+    first = dict(sql.execute('SELECT category, MIN(date) FROM %s GROUP BY category' % (
+        'catlog_all' if archive else 'catlog')))
+    counts, categories = stats_snapshot(sql, config, date)
+    if archive:
+        detach_archive(sql)
+
+    covered = {catname for catname, start in first.items() if start <= date}
+    keys = [k for k in counts if set(config['cats'][k]['categories']) <= covered]
+    skipped = [k for k in counts if k not in keys]
+    if not keys:
+        raise ValueError('catlog does not go back to %s for any category key' % date)
+    cur = sql.cursor()
+    if skipped and cur.execute('SELECT 1 FROM stats WHERE date=?', (date,)).fetchone() is None:
+        cur.close()
+        raise ValueError('There is no stats row for %s, and catlog does not go back to it for %s' % (
+            date, ', '.join(skipped)))
+    if skipped:
+        logger.warning('catlog does not go back to %s for %s, keeping the stored counts' % (
+            date, ', '.join(skipped)))
+    categories = {catname: count for catname, count in categories.items() if catname in covered}
+    cur.execute('UPDATE stats SET %s WHERE date=?' % ','.join('"%s"=?' % k for k in keys),
+                [counts[k] for k in keys] + [date])
+    if cur.rowcount:
+        for catname, count in categories.items():
+            cur.execute('INSERT INTO catstats (date,category,count) VALUES (?,?,?) '
+                        'ON CONFLICT (date, category) DO UPDATE SET count=excluded.count',
+                        (date, catname, count))
+    else:
+        row = cur.execute('SELECT articlecount FROM stats WHERE date<? ORDER BY date DESC LIMIT 1',
+                          (date,)).fetchone()
+        store_stats(cur, date, row[0] if row else 0, counts, categories)
+    sql.commit()
+    cur.close()
+    logger.info('Stats for %s: %s' % (date, ', '.join('%s=%d' % (k, counts[k]) for k in keys)))
+
+
+def merge_page(cur, old_id, new_id):
+    """Let new_id take over the memberships and history of old_id."""
+    cur.execute('UPDATE catlog SET page_id=? WHERE page_id=?', (new_id, old_id))
+    cur.execute('UPDATE cleanlog SET page_id=? WHERE page_id=?', (new_id, old_id))
+    cur.execute('UPDATE tags SET page_id=? WHERE page_id=?', (new_id, old_id))
+    cur.execute('UPDATE moves SET page_id=? WHERE page_id=?', (new_id, old_id))
+    cur.execute('UPDATE OR IGNORE catmembers SET page_id=? WHERE page_id=?', (new_id, old_id))
+    cur.execute('DELETE FROM catmembers WHERE page_id=?', (old_id,))
+    cur.execute('UPDATE OR IGNORE pagequeue SET page_id=? WHERE page_id=?', (new_id, old_id))
+    cur.execute('DELETE FROM pagequeue WHERE page_id=?', (old_id,))
+    cur.execute('DELETE FROM pages WHERE id=?', (old_id,))
+
+
+class RateLimiter:
+    """Enforce a minimum delay between API requests to avoid 429 rate limiting.
+
+    Each wiki gets its own limiter, so wikis running in parallel worker
+    processes do not slow each other down.
+    """
+
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.calls = 0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            remaining = self._last + self.delay - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            self._last = time.monotonic()
+            self.calls += 1
+
+
+class DbLock:
+    """Exclusive lock on a wiki's database, so the daily run and the daemon
+    never update it at the same time.
+
+    The lock is held on a file next to the database, and is released by the
+    operating system if the process dies.
+    """
+
+    def __init__(self, db):
+        self.path = db + '.lock'
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock. Returns False if blocking is False and the lock is held elsewhere."""
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
 
 class CatWatcher:
+    """Compare the current members of a category, {page ID: title} as
+    returned by MwApi.category_members, with catmembers and record the changes."""
 
-    def __init__(self, sql, site, category, subcategories=False, articlesonly=False, dryrun=False):
+    def __init__(self, sql, category, members, newpages, movelog=None, subcategories=False, dryrun=False):
 
         now = datetime.now().strftime('%F')
         cat_title = category.title(with_ns=False)
 
-        members0 = []
+        # Members are keyed by page ID, so a renamed page keeps its identity
+        members0 = {}
         cur = sql.cursor()
-        for row in cur.execute('SELECT page FROM catmembers WHERE category=?', (cat_title,)):
-            members0.append(row[0])
-
-        members1 = []
-        for p in category.members():
-            if not articlesonly or p.namespace() == 0:
-                members1.append(p.title())
+        for row in cur.execute('SELECT m.page_id, p.title FROM catmembers m JOIN pages p ON p.id = m.page_id '
+                               'WHERE m.category=?', (cat_title,)):
+            members0[row[0]] = row[1]
 
-        members0 = set(members0)
-        members1 = set(members1)
+        members1 = members
 
         self.members = members1
         self.count = len(members1)
 
-        self.removals = members0.difference(members1)
-        self.additions = members1.difference(members0)
+        self.removals = sorted((pid, members0[pid]) for pid in members0.keys() - members1.keys())
+        self.additions = sorted((pid, members1[pid]) for pid in members1.keys() - members0.keys())
 
         # Detect first-run seeding: if DB was empty, skip per-page API lookups
         self.seeding = len(members0) == 0 and len(self.additions) > 0
@@ -142,32 +856,48 @@ class CatWatcher:
             logger.info('    First run for %s — seeding %d members (skipping per-page checks)',
                         cat_title, len(self.additions))
 
-        for p in self.removals:
-            cur.execute('INSERT INTO catlog (date,category,page,added,new) VALUES (?,?,?,0,0)',
-                        (now, cat_title, p))
-            cur.execute('DELETE FROM catmembers WHERE category=? AND page=?',
-                        (cat_title, p))
-
-        for i, p in enumerate(self.additions):
-            isnew = 0
+        # A renamed page normally keeps its page ID. Pair up the remaining
+        # removals and additions that are explained by the move log, so they
+        # are recorded as renames and not as fikset/merket
+        self.renames = [(pid, members0[pid], members1[pid]) for pid in members0.keys() & members1.keys()
+                        if members0[pid] != members1[pid]]
+        merges = []
+        if self.removals and self.additions and movelog is not None:
+            added = {title: pid for pid, title in self.additions}
+            paired = set()
+            for pid, title in self.removals:
+                target = movelog.renamed_to(title)
+                if target in added and added[target] not in paired:
+                    merges.append((pid, added[target]))
+                    paired.update([pid, added[target]])
+                    self.renames.append((added[target], title, target))
+            self.removals = [r for r in self.removals if r[0] not in paired]
+            self.additions = [a for a in self.additions if a[0] not in paired]
+
+        # Do the API lookups before writing anything, so the write
+        # transaction is not kept open while waiting for the API
+        isnew = {}
+        for pid, p in self.additions:
+            isnew[pid] = 0
             if not self.seeding:
-                try:
-                    page_obj = pywikibot.Page(site, p)
-                    oldest = next(page_obj.revisions(reverse=True, total=1))
-                    ts = oldest.timestamp
-                    # Compare as naive UTC datetimes (pywikibot timestamps are UTC but naive)
-                    if ts.replace(tzinfo=None) > datetime.utcnow() - timedelta(days=7):
-                        isnew = 1
-                except (StopIteration, pywikibot.exceptions.Error):
-                    pass
-
-                # Throttle API requests to avoid 429 rate limiting
-                time.sleep(1)
-
-            cur.execute('INSERT INTO catmembers (date,category,page) VALUES (?,?,?)',
-                        (now, cat_title, p))
-            cur.execute('INSERT INTO catlog (date,category,page,added,new) VALUES (?,?,?,1,?)',
-                        (now, cat_title, p, isnew))
+                isnew[pid] = newpages.is_new(pid)
+
+        for old_id, new_id in merges:
+            merge_page(cur, old_id, new_id)
+
+        for pid, old_title, new_title in self.renames:
+            logger.info('    %s: renamed to %s' % (old_title, new_title))
+            cur.execute('INSERT INTO moves (date,page_id,old_title,new_title) VALUES (?,?,?,?)',
+                        (now, pid, old_title, new_title))
+
+        # Store titles of new and renamed pages
+        store_titles(cur, [(pid, title) for pid, title in members1.items() if members0.get(pid) != title])
+
+        for pid, p in self.removals:
+            record_removal(cur, now, cat_title, pid)
+
+        for pid, p in self.additions:
+            record_addition(cur, now, cat_title, pid, isnew[pid])
 
         sql.commit()
         cur.close()
@@ -175,100 +905,141 @@ class CatWatcher:
 
 class StatBot:
 
-    def __init__(self, dryrun=False):
+    # Number of queued pages looked up together in preflight
+    preflight_batch_size = 50
 
+    def __init__(self, config, site, limiter, dryrun=False):
+
+        self.config = config
+        self.cats = config['cats']
+        self.pages = config['pages']
         self.dryrun = dryrun
 
         logger.info("============== This is StatBot ==============")
 
-        self.site = pywikibot.Site('no', 'wikipedia')
-        self.site.login()
+        self.site = site
+        self.limiter = limiter
+        self.api = MwApi(site, limiter, endpoint=config['api_endpoint'])
 
-        self.sql = sqlite3.connect('vedlikehold.db')
+        self.sql = connect_db(config, self.api)
+        # Runs that crashed may not have updated catmembers, so only count finished ones
+        self.last_run = self.sql.execute('SELECT MAX(started) FROM runs WHERE finished IS NOT NULL').fetchone()[0]
 
-        # Auto-create tables if they don't exist
-        schema_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vedlikehold.sql')
-        if os.path.exists(schema_file):
-            with open(schema_file) as f:
-                self.sql.executescript(f.read())
-            logger.debug('Database schema ensured')
+    def run(self):
+        """Run the daily job: update the database, the statistics and the tickers."""
+
+        # Runs are stored with UTC timestamps, like the API uses
+        self.started = time.monotonic()
+        cur = self.sql.cursor()
+        cur.execute('INSERT INTO runs (started) VALUES (?)',
+                    (datetime.now(timezone.utc).strftime(API_TIME_FORMAT),))
+        self.run_id = cur.lastrowid
+        self.sql.commit()
+        cur.close()
 
         # Update DB
         self.check_cats()
+        budget = self.config['queue']
+        self.process_queue(deadline=self.started + budget['time_budget'], max_checks=budget['check_budget'])
 
         # Update stats
-        for k in cats.keys():
+        for k in self.cats.keys():
             self.update_wpstatpage(k)
 
         n = datetime.now()
-        text = '{{#switch:{{{1|}}}\n| dato = %04d%02d%02d%02d%02d%02d\n| {{Feil|Ukjent nøkkel}}\n}}' % (
+        text = '{{#switch:{{{1|}}}\n| dato = %04d%02d%02d%02d%02d%02d\n' % (
             n.year, n.month, n.day, n.hour, n.minute, n.second)
-        save_or_dump('Wikipedia:Underprosjekter/Vedlikehold og oppussing/Statistikk',
+        # Median age of current tags and median time to fix, in days
+        for k in self.cats.keys():
+            age, fixtime = tag_stats(self.sql, k)
+            if age is not None:
+                text += '| %s-alder = %.0f\n' % (k, age)
+            if fixtime is not None:
+                text += '| %s-fikstid = %.0f\n' % (k, fixtime)
+        text += '| {{Feil|Ukjent nøkkel}}\n}}'
+        save_or_dump(self.pages['stats'],
                      text, site=self.site, summary='Oppdaterer', dryrun=self.dryrun)
 
         # And ticker
         self.update_ticker()
 
+        # And leaderboards
+        self.update_leaderboards()
+
+        self.sql.execute('UPDATE runs SET finished=? WHERE id=?',
+                         (datetime.now(timezone.utc).strftime(API_TIME_FORMAT), self.run_id))
+        self.sql.commit()
+
     def check_cats(self):
 
         # Check all categories
         logger.info('Looking for member changes in maintenance categories')
-        counts = {}
         fikset = {}
         merket = {}
         self._seeded_keys = set()
-        for k in cats:
-            counts[k] = 0
+        since = self.last_run or (datetime.now(timezone.utc) - timedelta(days=1)).strftime(API_TIME_FORMAT)
+        movelog = MoveLog(self.api, since)
+        newpages = NewPages(self.api)
+
+        # Enumerating the categories is mostly waiting for the API, so it is
+        # done concurrently. The requests skip the rate limiter, which lets only
+        # one request start per api_delay however many workers there are.
+        # The database is only updated afterwards, in order
+        namespaces = {}
+        for k in self.cats:
+            for catname in self.cats[k]['categories']:
+                namespaces.setdefault(catname, self.cats[k]['namespaces'])
+        catnames = list(namespaces)
+        prefix = self.config['category_prefix']
+        with ThreadPoolExecutor(max_workers=self.config['enumeration_workers']) as pool:
+            members = dict(zip(catnames, pool.map(
+                lambda catname: dict(self.api.category_members(prefix + catname, namespaces[catname])),
+                catnames)))
+
+        before, _ = stats_snapshot(self.sql, self.config)
+        for k in self.cats:
             fikset[k] = []
             merket[k] = []
-            any_seeded = False
-            for catname in cats[k]['categories']:
-                cat = pywikibot.Category(self.site, 'Kategori:' + catname)
-                watcher = CatWatcher(self.sql, self.site, cat, dryrun=self.dryrun)
+            for catname in self.cats[k]['categories']:
+                cat = pywikibot.Category(self.site, prefix + catname)
+                watcher = CatWatcher(self.sql, cat, members[catname], newpages, movelog=movelog,
+                                     dryrun=self.dryrun)
                 if watcher.seeding:
-                    any_seeded = True
-                counts[k] += watcher.count
+                    self._seeded_keys.add(k)
                 fikset[k].extend(watcher.removals)
                 merket[k].extend(watcher.additions)
+        counts, categories = stats_snapshot(self.sql, self.config)
+
+        for k in self.cats:
             if len(fikset[k]) > 0 or len(merket[k]) > 0:
-                logger.info('    %s: %d -> %d members' % (
-                    k, counts[k] - len(merket[k]) + len(fikset[k]), counts[k]))
+                logger.info('    %s: %d -> %d members' % (k, before[k], counts[k]))
                 logger.debug("      fikset (%d): " % len(fikset[k]))
-                for r in fikset[k]:
+                for pid, r in fikset[k]:
                     logger.debug("%s, " % r)
                 logger.debug("      merket (%d): " % len(merket[k]))
-                for r in merket[k]:
+                for pid, r in merket[k]:
                     logger.debug("%s, " % r)
             else:
                 logger.info('    %s: no changes' % k)
-            if any_seeded:
-                self._seeded_keys.add(k)
 
-        # Look for templates in each page that was added or removed
+        # Queue a template lookup for each page that was added or removed
         # Skip on first run (seeding) — no meaningful diffs to check
-        logger.info('Locating revisions when templates were inserted/removed')
-        for k in cats:
+        cur = self.sql.cursor()
+        for k in self.cats:
             if k in self._seeded_keys:
                 logger.info('    Skipping check_page for %s (first run seeding)', k)
                 continue
-            for p in fikset[k]:
-                self.check_page(p, 'fikset', k, cats[k]['templates'])
-            for p in merket[k]:
-                self.check_page(p, 'merket', k, cats[k]['templates'])
+            for pid, p in fikset[k]:
+                queue_check(cur, pid, k, 'fikset', since=self.last_run)
+            for pid, p in merket[k]:
+                queue_check(cur, pid, k, 'merket', since=self.last_run)
 
         # Update database
         logger.info('Updating database')
-        cur = self.sql.cursor()
         stats = self.site.siteinfo.get('statistics')
         narticles = stats['articles']
 
-        now = datetime.now().strftime('%F')
-        data = [now, narticles, counts['opprydning'], counts['oppdatering'],
-                counts['interwiki'], counts['flytting'], counts['fletting'],
-                counts['språkvask'], counts['kilder'], counts['ukategorisert']]
-        cur.execute('''INSERT INTO stats (date,articlecount,opprydning,oppdatering,interwiki,
-                flytting,fletting,språkvask,kilder,ukategorisert)
-                VALUES(?,?,?,?,?,?,?,?,?,?)''', data)
+        store_stats(cur, datetime.now().strftime('%F'), narticles, counts, categories)
         self.sql.commit()
         cur.close()
 
@@ -279,26 +1050,32 @@ class StatBot:
         total = 0
         processed = 0
 
-        for k in cats:
+        for k in self.cats:
             pages_to_check = []
-            for catname in cats[k]['categories']:
+            for catname in self.cats[k]['categories']:
                 for row in cur.execute(
-                    'SELECT m.page FROM catmembers m '
+                    'SELECT m.page_id, p.title FROM catmembers m JOIN pages p ON p.id = m.page_id '
                     'WHERE m.category=? AND NOT EXISTS ('
-                    '  SELECT 1 FROM cleanlog c WHERE c.page=m.page AND c.category=?)',
+                    '  SELECT 1 FROM cleanlog c WHERE c.page_id=m.page_id AND c.category=?)',
                     (catname, k)):
-                    pages_to_check.append(row[0])
+                    pages_to_check.append((row[0], row[1]))
 
             if not pages_to_check:
                 logger.info('    %s: all pages already have cleanlog entries', k)
                 continue
 
+            live = self.preflight(pages_to_check)
+            pages_to_check = [(pid, live[pid]['title']) for pid, p in pages_to_check if pid in live]
             total += len(pages_to_check)
             logger.info('    %s: %d pages to backfill', k, len(pages_to_check))
 
-            for i, p in enumerate(pages_to_check):
+            for i, (pid, p) in enumerate(pages_to_check):
                 logger.info('    [%d/%d] Backfilling %s (%s)', i + 1, len(pages_to_check), p, k)
-                self.check_page(p, 'merket', k, cats[k]['templates'])
+                try:
+                    self.check_page(pid, p, 'merket', k, self.cats[k]['templates'],
+                                    lastrevid=live[pid]['lastrevid'])
+                except pywikibot.exceptions.Error as e:
+                    logger.warning('    %s: pywikibot error: %s' % (p, str(e)))
                 processed += 1
 
                 # Commit every 50 pages to save progress
@@ -310,59 +1087,113 @@ class StatBot:
         cur.close()
         logger.info('Backfill complete: %d pages processed', processed)
 
-    def check_page(self, p, q, catkey, templates):
+    @staticmethod
+    def revisions_since(page_obj, since, total=100):
+        """Yield revisions newest first, like page_obj.revisions(), but only
+        fetch the ones after `since` and the one just before it up front.
+        Older revisions are only fetched if the caller keeps iterating, i.e.
+        when there was no template change within that window."""
+        since = pywikibot.Timestamp.fromISOformat(since)
+        seen = set()
+        for rev in page_obj.revisions(content=True, total=total, endtime=since):
+            seen.add(rev.revid)
+            yield rev
+        before = list(page_obj.revisions(content=True, total=1, starttime=since))
+        if not before:
+            return
+        if before[0].revid not in seen:
+            seen.add(before[0].revid)
+            yield before[0]
+        logger.debug('    %s: no template change since %s, checking older revisions' % (page_obj.title(), since))
+        for rev in page_obj.revisions(content=True, total=total, starttime=before[0].timestamp):
+            if rev.revid not in seen:
+                yield rev
+
+    def preflight(self, pages):
+        """Look up all the (page ID, title) pages in batched info queries and
+        return {page ID: info} for those that should be scanned by check_page.
+        Deleted pages and redirects are logged and left out. Pages that have
+        been renamed get their current title stored."""
+        pages = dict(pages)
+        # Negative IDs belong to pages that were already deleted when the database was migrated
+        info = self.api.page_info([pid for pid in pages if pid > 0])
+        live = {}
+        cur = self.sql.cursor()
+        for pid, p in pages.items():
+            page = info.get(pid, {'missing': True})
+            if page.get('missing'):
+                logger.info("    %s: page does not exist (deleted?)" % p)
+            elif page.get('redirect'):
+                logger.info('    %s: found redirect page' % p)
+            else:
+                live[pid] = page
+                if page['title'] != p:
+                    logger.info('    %s: renamed to %s' % (p, page['title']))
+                    cur.execute('INSERT INTO moves (date,page_id,old_title,new_title) VALUES (?,?,?,?)',
+                                (datetime.now().strftime('%F'), pid, p, page['title']))
+                    store_titles(cur, [(pid, page['title'])])
+        cur.close()
+        return live
+
+    def check_page(self, page_id, p, q, catkey, templates, since=None, lastrevid=None):
+        """Find the revision where the template was inserted (merket) or
+        removed (fikset) and log it. The page should have passed preflight,
+        and revisions newer than the lastrevid it returned are skipped, so the
+        scan sees the page as preflight did.
+        Raises pywikibot.exceptions.Error if the revisions could not be fetched."""
         foundTemplateChange = False
         revschecked = 0
         lastrev = -1
         tagged_from_beginning = False
 
-        try:
-            page_obj = pywikibot.Page(self.site, p)
-            if not page_obj.exists():
-                logger.info("    %s: page does not exist (deleted?)" % p)
-                return
-
-            for rev in page_obj.revisions(content=True, total=100):
-                revschecked += 1
-                logger.debug(" checking (%s)" % rev.revid)
+        page_obj = pywikibot.Page(self.site, p)
 
-                try:
-                    txt = rev.text
-                    user = rev.user
-                except Exception:
-                    # Revision text and/or user may be hidden/suppressed
-                    continue
+        # Pages that changed since the previous run must have had the template
+        # inserted/removed after it, so start by only looking at those revisions
+        if since:
+            revisions = self.revisions_since(page_obj, since)
+        else:
+            revisions = page_obj.revisions(content=True, total=100)
 
-                if txt is None:
-                    continue
+        for rev in revisions:
+            if lastrevid is not None and rev.revid > lastrevid:
+                continue
+            revschecked += 1
+            logger.debug(" checking (%s)" % rev.revid)
+
+            try:
+                txt = rev.text
+                user = rev.user
+            except Exception:
+                # Revision text and/or user may be hidden/suppressed
+                continue
 
-                if '#OMDIRIGERING [[' in txt or '#REDIRECT[[' in txt:
-                    logger.info('    %s: found redirect page' % p)
-                    foundTemplateChange = True
-                    lastrev = -1
-                    break
+            if txt is None:
+                continue
 
-                foundTemplateChange = True if q == 'merket' else False
-                m = re.search(r'{{(%s)[\s]*(\||}})' % '|'.join(templates), txt, re.IGNORECASE)
-                if m:
-                    logger.debug("    Found template: %s" % m.group(1))
-                    foundTemplateChange = False if q == 'merket' else True
-                if foundTemplateChange:
+            if '#OMDIRIGERING [[' in txt or '#REDIRECT[[' in txt:
+                logger.info('    %s: found redirect page' % p)
+                foundTemplateChange = True
+                lastrev = -1
+                break
+
+            foundTemplateChange = True if q == 'merket' else False
+            m = re.search(r'{{(%s)[\s]*(\||}})' % '|'.join(templates), txt, re.IGNORECASE)
+            if m:
+                logger.debug("    Found template: %s" % m.group(1))
+                foundTemplateChange = False if q == 'merket' else True
+            if foundTemplateChange:
+                break
+            else:
+                lastrev = rev.revid
+                lastrevuser = rev.user
+                revts = rev.timestamp
+
+                # Check if we've reached the first revision
+                if rev.parentid == 0:
+                    tagged_from_beginning = True
+                    logger.info('    %s: %s %s, was tagged from beginning' % (p, q, catkey))
                     break
-                else:
-                    lastrev = rev.revid
-                    lastrevuser = rev.user
-                    revts = rev.timestamp
-
-                    # Check if we've reached the first revision
-                    if rev.parentid == 0:
-                        tagged_from_beginning = True
-                        logger.info('    %s: %s %s, was tagged from beginning' % (p, q, catkey))
-                        break
-
-        except pywikibot.exceptions.Error as e:
-            logger.warning('    %s: pywikibot error: %s' % (p, str(e)))
-            return
 
         if lastrev == -1:
             if not foundTemplateChange and not tagged_from_beginning:
@@ -374,39 +1205,107 @@ class StatBot:
             logger.info('    %s: %s %s in rev %s by %s (checked %d revisions)' % (
                 p, q, catkey, lastrev, lastrevuser, revschecked))
             cur = self.sql.cursor()
-            cur.execute('''INSERT INTO cleanlog (date, category, action, page, user, revision)
-                VALUES(?,?,?,?,?,?)''',
-                (revts_str, catkey, q, p, lastrevuser, lastrev))
+            log_cleanup(cur, revts_str, catkey, q, page_id, lastrevuser, lastrev)
             cur.close()
 
-        time.sleep(1)
+        self.limiter.wait()
 
-    def update_wpstatpage(self, catkey):
+    def process_queue(self, deadline=None, max_checks=None):
+        """Do the queued page checks that are due, oldest first, until the
+        queue is empty, time.monotonic() passes `deadline` or `max_checks`
+        pages have been checked. Failed checks are retried later with
+        exponential backoff. Returns the category keys of the checks done.
 
-        now = datetime.now()
-        year = now.strftime('%Y')
+        Each check is claimed before it is done, so the daemon and the daily
+        run never do the same check.
+        """
+        budget = self.config['queue']
+        cur = self.sql.cursor()
+        now = datetime.now(timezone.utc)
+        due = cur.execute(
+            'SELECT q.rowid, q.page_id, p.title, q.category, q.action, q.since, q.attempts, q.next_attempt '
+            'FROM pagequeue q JOIN pages p ON p.id = q.page_id WHERE q.next_attempt <= ? '
+            'ORDER BY q.queued, q.rowid', (now.strftime(API_TIME_FORMAT),)).fetchall()
+        if not due:
+            cur.close()
+            return set()
 
-        title = 'Wikipedia:Underprosjekter/Vedlikehold og oppussing/Statistikk/%s-%s' % (catkey, year)
-        catstr = '\n'.join(['*[[:Kategori:%s]]' % c for c in cats[catkey]['categories']])
-        doc = """
-Denne malen er en tabell over hvor mange sider det på ulike datoer i %(year)s befant seg i kategorien(e):
-%(cats)s
-Tallet inkluderer både artikler og andre sider, men ikke sider i underkategorier. Malen har data siden 14. mai 2012.
+        logger.info('Locating revisions when templates were inserted/removed')
+        done = set()
+        checked = failed = 0
+        # Pages are looked up in preflight one batch at a time, so a large
+        # queue is not looked up again in every pass that only gets through part of it
+        for batch in chunks(due, self.preflight_batch_size):
+            if (deadline is not None and time.monotonic() >= deadline) \
+                    or (max_checks is not None and checked >= max_checks):
+                logger.info('    Run budget used up')
+                break
+            try:
+                live = self.preflight((row[1], row[2]) for row in batch)
+            except (pywikibot.exceptions.Error, requests.RequestException) as e:
+                logger.warning('    Page info lookup failed, leaving the queue for later: %s' % e)
+                break
+            self.sql.commit()
+
+            for rowid, pid, p, catkey, q, since, attempts, next_attempt in batch:
+                if catkey not in self.cats or pid not in live:
+                    # Deleted pages and redirects have nothing to scan, and the
+                    # category key may have been removed from the config
+                    cur.execute('DELETE FROM pagequeue WHERE rowid=?', (rowid,))
+                    continue
+                if (deadline is not None and time.monotonic() >= deadline) \
+                        or (max_checks is not None and checked >= max_checks):
+                    continue
 
-'''Bruk:''' (NB! Malen er under arbeid, og vil på et tidspunkt bli flyttet til en ny plassering uten omdirigering)
+                # If this process dies during the check, the claim runs out and the check is due again
+                claim = datetime.now(timezone.utc) + timedelta(seconds=budget['retry_delay'])
+                cur.execute('UPDATE pagequeue SET next_attempt=? WHERE rowid=? AND next_attempt=?',
+                            (claim.strftime(API_TIME_FORMAT), rowid, next_attempt))
+                claimed = cur.rowcount
+                self.sql.commit()
+                if not claimed:
+                    # Done or claimed by another process since the queue was read
+                    continue
+                p = live[pid]['title']
+                try:
+                    self.check_page(pid, p, q, catkey, self.cats[catkey]['templates'], since=since,
+                                    lastrevid=live[pid]['lastrevid'])
+                except pywikibot.exceptions.Error as e:
+                    delay = min(budget['retry_delay'] * 2 ** attempts, budget['max_retry_delay'])
+                    retry = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                    logger.warning('    %s: pywikibot error: %s (retrying after %s)' % (
+                        p, str(e), retry.strftime(API_TIME_FORMAT)))
+                    cur.execute('UPDATE pagequeue SET attempts=attempts+1, next_attempt=?, last_error=? '
+                                'WHERE rowid=?', (retry.strftime(API_TIME_FORMAT), str(e), rowid))
+                    failed += 1
+                else:
+                    cur.execute('DELETE FROM pagequeue WHERE rowid=?', (rowid,))
+                    done.add(catkey)
+                checked += 1
+                # Commit after every page, so no finished check is done twice
+                self.sql.commit()
+
+        self.sql.commit()
+        left = cur.execute('SELECT COUNT(*) FROM pagequeue').fetchone()[0]
+        cur.close()
+        logger.info('    %d page checks done, %d failed, %d left in the queue' % (checked, failed, left))
+        return done
 
-: <code><nowiki>{{</nowiki>{{FULLPAGENAME}}|YYYY-MM-DD<nowiki>}}</nowiki></code>
+    def update_wpstatpage(self, catkey):
 
-'''Eksempel:'''
+        now = datetime.now()
+        year = now.strftime('%Y')
 
-: <code><nowiki>{{</nowiki>{{FULLPAGENAME}}<nowiki>|%(year)s-05-14}}</nowiki></code> → {{%(templatename)s|%(year)s-05-14}}
-""" % {'cats': catstr, 'templatename': title, 'year': year}
+        title = self.pages['stats_year'].format(catkey=catkey, year=year)
+        catstr = '\n'.join(['*[[:%s%s]]' % (self.config['category_prefix'], c)
+                             for c in self.cats[catkey]['categories']])
+        doc = self.config['stats_doc'] % {'cats': catstr, 'templatename': title, 'year': year}
 
         cur = self.sql.cursor()
         latest = '0'
         text = ''
         for row in cur.execute(
-                'SELECT date,%s FROM stats WHERE date>=? AND date<=? GROUP BY date ORDER by DATE asc' % catkey,
+                'SELECT date,"%s" FROM stats WHERE date>=? AND date<=? GROUP BY date ORDER by DATE asc' % catkey,
                 (year + '-01-01', year + '-12-31')):
             text += ' | %s = %s\n' % (row[0], row[1])
             latest = row[1]
@@ -421,9 +1320,9 @@ Tallet inkluderer både artikler og andre sider, men ikke sider i underkategorie
 
         # Miniticker
         miniticker = Ticker(
-            sql=self.sql, limit=12, extended=False,
-            fikset_kat=['opprydning', 'opprydning2', 'interwiki', 'språkvask', 'kilder', 'ref2'],
-            merket_kat=['opprydning', 'opprydning2', 'språkvask']
+            sql=self.sql, config=self.config, limit=12, extended=False,
+            fikset_kat=self.config['miniticker']['fikset'],
+            merket_kat=self.config['miniticker']['merket']
         )
         text = '{|\n'
         for dt in miniticker.entries.keys():
@@ -433,27 +1332,85 @@ Tallet inkluderer både artikler og andre sider, men ikke sider i underkategorie
                 text += entry + '\n'
                 fc = ''
         text += '|}'
-        save_or_dump('Wikipedia:Underprosjekter/Vedlikehold og oppussing/Ticker-mini',
+        save_or_dump(self.pages['ticker_mini'],
                      text, site=self.site, summary='Oppdaterer', dryrun=self.dryrun)
 
         # Big ticker
-        bigticker = Ticker(sql=self.sql, limit=200, extended=True)
-        text = '{{Wikipedia:Underprosjekter/Vedlikehold og oppussing/Toppnav}}'
-        text += '{{Wikipedia:Underprosjekter/Vedlikehold og oppussing/Ticker-header}}\n'
+        bigticker = Ticker(sql=self.sql, config=self.config, limit=200, extended=True)
+        text = '{{%s}}' % self.pages['toppnav']
+        text += '{{%s}}\n' % self.pages['ticker_header']
         text += '{|\n'
         for dt in bigticker.entries.keys():
             text += '|-\n| colspan=4 style="font-weight:bold; border-bottom: 1px solid #888;" | %s\n' % dt
             for entry in bigticker.entries[dt]:
                 text += entry + '\n'
         text += '|}'
-        save_or_dump('Wikipedia:Underprosjekter/Vedlikehold og oppussing/Ticker',
+        save_or_dump(self.pages['ticker'],
                      text, site=self.site, summary='Oppdaterer', dryrun=self.dryrun)
 
+    def update_leaderboards(self):
+        """Publish the user leaderboard and the monthly summary from the rollup tables."""
+        labels = {'fikset': 'Fikset', 'merket': 'Merket'}
+        cur = self.sql.cursor()
+
+        if self.pages.get('leaderboard'):
+            months = [row[0] for row in cur.execute(
+                'SELECT DISTINCT month FROM monthtotals ORDER BY month DESC LIMIT 2')]
+            text = '{{%s}}\n' % self.pages['toppnav']
+            for month in months:
+                title = datetime.strptime(month, '%Y-%m').strftime('%B %Y')
+                text += '== %s ==\n' % title.capitalize()
+                text += '{| class="wikitable"\n! Kategori !! %s !! %s\n' % (labels['fikset'], labels['merket'])
+                for k in self.cats:
+                    text += '|-\n| %s' % k
+                    for action in ['fikset', 'merket']:
+                        top = cur.execute(
+                            'SELECT user, count FROM usermonth WHERE month=? AND category=? AND action=? '
+                            'ORDER BY count DESC, user LIMIT 5', (month, k, action)).fetchall()
+                        text += ' || ' + ', '.join('[[User:%s|%s]] (%d)' % (u, u, n) for u, n in top)
+                    text += '\n'
+                text += '|}\n'
+
+            text += '== Totalt ==\n'
+            text += '{| class="wikitable sortable"\n! # !! Bruker !! %s !! %s\n' % (labels['fikset'], labels['merket'])
+            rows = cur.execute(
+                'SELECT user, SUM(CASE WHEN action="fikset" THEN count ELSE 0 END) AS fikset, '
+                'SUM(CASE WHEN action="merket" THEN count ELSE 0 END) FROM usermonth '
+                'GROUP BY user ORDER BY fikset DESC, user LIMIT 50').fetchall()
+            for i, (user, fikset, merket) in enumerate(rows):
+                text += '|-\n| %d || [[User:%s|%s]] || %d || %d\n' % (i + 1, user, user, fikset, merket)
+            text += '|}\n'
+            save_or_dump(self.pages['leaderboard'], text, site=self.site, summary='Oppdaterer', dryrun=self.dryrun)
+
+        if self.pages.get('monthly'):
+            keys = list(self.cats.keys())
+            text = '{{%s}}\n' % self.pages['toppnav']
+            text += '{| class="wikitable sortable"\n! Måned !! %s\n' % ' !! '.join(keys)
+            totals = {}
+            for month, k, action, count in cur.execute('SELECT month, category, action, count FROM monthtotals'):
+                totals.setdefault(month, {}).setdefault(k, {})[action] = count
+            for month in sorted(totals, reverse=True):
+                text += '|-\n| %s' % month
+                for k in keys:
+                    counts = totals[month].get(k, {})
+                    text += ' || %d / %d' % (counts.get('fikset', 0), counts.get('merket', 0))
+                text += '\n'
+            text += '|}\n'
+            text += "''%s / %s''\n" % (labels['fikset'], labels['merket'])
+            save_or_dump(self.pages['monthly'], text, site=self.site, summary='Oppdaterer', dryrun=self.dryrun)
+
+        cur.close()
+
 
 class Ticker:
 
-    def __init__(self, sql, fikset_kat=None, merket_kat=None, limit=10, extended=False):
+    def __init__(self, sql, config, fikset_kat=None, merket_kat=None, limit=10, extended=False):
         self.sql = sql
+        self.row_template = config['pages']['ticker_row']
+        self.category_prefix = config['category_prefix']
+        self.icons = config['ticker']['icons']
+        self.category_icons = config['ticker']['category_icons']
+        self.verbs = config['ticker']['verbs']
         if fikset_kat is None:
             fikset_kat = []
         if merket_kat is None:
@@ -461,71 +1418,26 @@ class Ticker:
         self.run(fikset_kat, merket_kat, limit, extended)
 
     def format_ticker_entry(self, cursor, row, maxlen=-1, extended=False):
-        verb = {
-            'fikset': {
-                'opprydning': 'ryddet',
-                'opprydning2': 'ryddet',
-                'oppdatering': 'oppdatert',
-                'interwiki': 'interwikiet',
-                'språkvask': 'språkvasket',
-                'kilder': 'kildebelagt',
-                'ref2': 'kildebelagt',
-                'ukategorisert': 'kategorisert',
-                'flytting': ': flytteforslag avgjort av',
-                'fletting': ': fletteforslag avgjort av'
-            },
-            'merket': {
-                'opprydning': 'trenger rydding',
-                'opprydning2': 'trenger rydding',
-                'oppdatering': 'trenger oppdatering',
-                'interwiki': 'mangler interwiki',
-                'språkvask': 'trenger språkvask',
-                'kilder': 'trenger kilder',
-                'ref2': 'trenger kilder',
-                'ukategorisert': 'mangler kategorier',
-                'flytting': 'foreslått flyttet',
-                'fletting': 'foreslått flettet'
-            },
-        }
-        icons = {
-            'fikset': 'QsiconSupporting.svg',
-            'merket': 'Qsicon Achtung.svg'
-        }
-        caticons = {
-            'opprydning': 'Broom icon.svg',
-            'opprydning2': 'Broom icon.svg',
-            'oppdatering': 'Gnome globe current event.svg',
-            'interwiki': 'Farm-Fresh flag orange.png',
-            'flytting': 'Merge-arrow.svg',
-            'fletting': 'Merge-split-transwiki default.svg',
-            'språkvask': 'Spelling icon.svg',
-            'kilder': 'Question book-new.svg',
-            'ref2': 'Question book-new.svg',
-            'ukategorisert': 'Farm-Fresh three tags.png'
-        }
-
-        # id,date,category,page,user,revision,action
+        # id,date,category,page,user,revision,action,page_id
         revid = row[5]
 
         revts = datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S')
-        f = {'title': row[3], 'diff': 'prev', 'oldid': row[5]}
-        link = 'https://no.wikipedia.org/w/index.php?%s' % urllib.parse.urlencode(f)
-
         action = row[6]
         user = row[4]
         title = row[3]
         if 0 < maxlen < len(title):
             title = title + '|' + title[:(maxlen - 3)] + '…'
-        if title.startswith('Kategori:'):
+        if title.startswith(self.category_prefix):
             title = ':' + title
-        entry = '{{Wikipedia:Underprosjekter/Vedlikehold og oppussing/Ticker-rad'
+        entry = '{{' + self.row_template
         entry += '|%s|%s|%s|%s|%s|%s' % (revts.strftime('%H:%M'), action, row[2], title, user, revid)
-        icon = icons[action]
-        caticon = caticons[row[2]]
+        verb = self.verbs.get(action, {}).get(row[2], action)
+        icon = self.icons.get(action)
+        caticon = self.category_icons.get(row[2])
         if action == 'fikset':
             cursor.execute(
-                'SELECT id FROM cleanlog WHERE page=? AND category=? AND action="merket" AND date>?',
-                [row[3], row[2], row[1]])
+                'SELECT id FROM tags WHERE page_id=? AND category=? AND tagged>? LIMIT 1',
+                [row[7], row[2], row[1]])
             s = cursor.fetchall()
             if len(s) > 0:
                 entry += '|strikeout=1'
@@ -556,8 +1468,9 @@ class Ticker:
             qargs.extend(merket_kat)
 
         qargs.append(limit)
-        query = 'SELECT id,date,category,page,user,revision,action FROM cleanlog' + whereClause \
-                + ' GROUP BY action,category,page ORDER BY date DESC LIMIT ?'
+        query = 'SELECT c.id,date,category,p.title,user,revision,action,page_id FROM cleanlog c ' \
+                + 'JOIN pages p ON p.id = c.page_id' + whereClause \
+                + ' GROUP BY action,category,page_id ORDER BY date DESC LIMIT ?'
 
         for row in cur.execute(query, qargs):
             shortdt, entry = self.format_ticker_entry(cur2, row, extended=extended)
@@ -571,21 +1484,15 @@ class Ticker:
         self.entries = ticker
 
 
-special_pages = {
-    'flytting': 'Wikipedia:Flytteforslag'
-}
-
-
 class CatOverview:
 
-    def __init__(self, dryrun=False):
+    def __init__(self, config, site, dryrun=False, keys=None):
 
-        site = pywikibot.Site('no', 'wikipedia')
-        site.login()
+        self.config = config
+        cats = {k: v for k, v in config['cats'].items() if keys is None or k in keys}
 
-        sql = sqlite3.connect('vedlikehold.db')
+        sql = connect_db(config)
         cur = sql.cursor()
-        cur2 = sql.cursor()
 
         # Entries
         pages = {}
@@ -594,17 +1501,19 @@ class CatOverview:
             logger.info("Checking category class: %s" % k)
             pages[k] = []
             for catname in cats[k]['categories']:
-                for row in cur.execute('SELECT page FROM catmembers WHERE category=?', [catname]):
-                    pagename = row[0]
-                    revts = 0
-                    for row2 in cur2.execute(
-                            'SELECT date, revision FROM cleanlog WHERE page=? AND category=? '
-                            'AND action="merket" ORDER BY DATE DESC LIMIT 1',
-                            [pagename, k]):
-                        revts = datetime.strptime(row2[0], '%Y-%m-%d %H:%M:%S')
-                        pages[k].append({'name': pagename, 'tagged': revts, 'rev': row2[1]})
-                    if revts == 0:
-                        pages[k].append({'name': pagename, 'tagged': 0, 'rev': 0})
+                # Latest tagging of each member
+                for row in cur.execute(
+                        'SELECT p.title, t.tagged, t.tagged_revision FROM catmembers m '
+                        'JOIN pages p ON p.id = m.page_id '
+                        'LEFT JOIN tags t ON t.id = ('
+                        '  SELECT id FROM tags WHERE page_id=m.page_id AND category=? AND tagged IS NOT NULL '
+                        '  ORDER BY tagged DESC LIMIT 1) '
+                        'WHERE m.category=?', [k, catname]):
+                    if row[1] is not None:
+                        revts = datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S')
+                        pages[k].append({'name': row[0], 'tagged': revts, 'rev': row[2]})
+                    else:
+                        pages[k].append({'name': row[0], 'tagged': 0, 'rev': 0})
 
             taggedentries = [p for p in pages[k] if p['tagged'] != 0]
             untaggedentries = [p for p in pages[k] if p['tagged'] == 0]
@@ -613,13 +1522,12 @@ class CatOverview:
             logger.info("   Tagged: %d, untagged: %d" % (len(taggedentries), len(untaggedentries)))
 
         # Pages
-        for k in ['opprydning', 'oppdatering', 'interwiki', 'flytting', 'fletting',
-                   'språkvask', 'kilder', 'ukategorisert']:
-            pagename = 'Wikipedia:Underprosjekter/Vedlikehold og oppussing/' + k.capitalize()
+        for k in cats:
+            pagename = config['pages']['overview'].format(catname=k.capitalize())
             text = '{{%s}}\n' % (pagename + '/intro')
 
-            if k in special_pages:
-                text += '{{%s}}\n' % special_pages[k]
+            if k in config['special_pages']:
+                text += '{{%s}}\n' % config['special_pages'][k]
             else:
                 taggedentries = [p for p in pages[k] if p['tagged'] != 0]
                 if len(taggedentries) > 50:
@@ -631,11 +1539,14 @@ class CatOverview:
                     text += self.allpages('Merkede sider', pages[k])
 
             text += '\n==Siste oppdateringer==\n'
-            text += '{{Wikipedia:Underprosjekter/Vedlikehold og oppussing/Ticker-header}}\n'
+            text += '{{%s}}\n' % config['pages']['ticker_header']
             text += self.ticker(sql, k) + '\n'
 
             save_or_dump(pagename, text, site=site, summary='CatOverview oppdaterer', dryrun=dryrun)
 
+        cur.close()
+        sql.close()
+
     def allpages(self, title, pages):
         half = int(len(pages) / 2)
         return self.formatsection(title, [pages[:half], pages[half:]])
@@ -653,7 +1564,7 @@ class CatOverview:
 
     def formatrow(self, p):
         name = p['name']
-        if name[0:8] == 'Kategori':
+        if name.startswith(self.config['category_prefix']):
             name = ':' + name
         if p['tagged'] == 0:
             return '|-\n| [[%s]] || %s\n' % (name, '--')
@@ -661,7 +1572,7 @@ class CatOverview:
             return '|-\n| [[%s]] || %s\n' % (name, p['tagged'].strftime('%e. %B %Y'))
 
     def ticker(self, sql, cat):
-        ticker = Ticker(sql=sql, limit=200, extended=True, fikset_kat=[cat], merket_kat=[cat])
+        ticker = Ticker(sql=sql, config=self.config, limit=200, extended=True, fikset_kat=[cat], merket_kat=[cat])
         text = '{|\n'
         for dt in ticker.entries.keys():
             text += '|-\n| colspan=4 style="font-weight:bold; border-bottom: 1px solid #888;" | %s\n' % dt
@@ -671,34 +1582,548 @@ class CatOverview:
         return text
 
 
-try:
-
-    runstart = datetime.now()
+def read_event_stream(url, last_event_id=None, timeout=60):
+    """Yield (id, data) for each message of a server-sent events stream."""
+    headers = {'Accept': 'text/event-stream', 'User-Agent': USER_AGENT}
+    if last_event_id:
+        headers['Last-Event-ID'] = last_event_id
+    with requests.get(url, stream=True, headers=headers, timeout=(10, timeout)) as response:
+        response.raise_for_status()
+        response.encoding = 'utf-8'
+        event_id = None
+        data = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                # A blank line ends the message
+                if data:
+                    yield event_id, '\n'.join(data)
+                data = []
+                continue
+            if line.startswith(':'):
+                continue
+            field, _, value = line.partition(':')
+            if value.startswith(' '):
+                value = value[1:]
+            if field == 'data':
+                data.append(value)
+            elif field == 'id':
+                event_id = value
+
+
+class EventStreamReader(threading.Thread):
+    """Read a server-sent events stream in the background and put the decoded
+    JSON events for one wiki on a queue, reconnecting whenever the connection drops."""
+
+    def __init__(self, url, wiki, events):
+        super().__init__(name='EventStreamReader', daemon=True)
+        self.url = url
+        self.wiki = wiki
+        self.events = events
+
+    def run(self):
+        last_event_id = None
+        delay = 1
+        while True:
+            try:
+                for event_id, data in read_event_stream(self.url, last_event_id):
+                    last_event_id = event_id or last_event_id
+                    delay = 1
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        logger.debug('Skipping malformed event: %s' % data[:200])
+                        continue
+                    if event.get('wiki') == self.wiki:
+                        self.events.put(event)
+                logger.warning('Event stream closed, reconnecting in %d s' % delay)
+            except requests.RequestException as e:
+                logger.warning('Event stream error: %s, reconnecting in %d s' % (e, delay))
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+
+class StreamWatcher:
+    """Keep catmembers, catlog and cleanlog up to date from the recent changes
+    stream, and republish the tickers and overview pages once things calm down.
+
+    Edited pages are collected for `check_interval` seconds and then looked up
+    in one batched categories query. Pages that entered or left a tracked
+    category are handled like in the daily run. Template changes that alter
+    the categories of many pages at once are left to the daily run.
+    """
+
+    def __init__(self, bot, dryrun=False):
+        self.bot = bot
+        self.config = bot.config
+        self.stream = bot.config['stream']
+        self.dryrun = dryrun
+        prefix = self.config['category_prefix']
+        self.catkeys = {}
+        self.namespaces = {}
+        for k in self.config['cats']:
+            for catname in self.config['cats'][k]['categories']:
+                self.catkeys[catname] = k
+                self.namespaces.setdefault(catname, self.config['cats'][k]['namespaces'])
+        self.cattitles = [prefix + catname for catname in self.catkeys]
+        self.newpages = NewPages(bot.api)
+
+    def run(self):
+        logger.info("============== This is StreamWatcher ==============")
+        events = queue.Queue()
+        EventStreamReader(self.stream['url'], self.bot.site.dbName(), events).start()
+
+        pending = {}
+        dirty = set()
+        last_check = time.monotonic()
+        first_change = last_change = None
+        while True:
+            try:
+                event = events.get(timeout=1)
+            except queue.Empty:
+                event = None
+            if event and event.get('type') in ('edit', 'new'):
+                title = event['title']
+                pending[title] = min(pending.get(title, event['timestamp']), event['timestamp'])
+
+            now = time.monotonic()
+            if now - last_check >= self.stream['check_interval']:
+                changed = set()
+                lock = DbLock(self.config['db'])
+                if not lock.acquire(blocking=False):
+                    # The daily run is updating the database, keep collecting until it is done
+                    logger.debug('Database is locked by the daily run, %d pages pending' % len(pending))
+                else:
+                    try:
+                        if pending:
+                            changed = self.check_pages(pending)
+                            pending = {}
+                        # Queued checks get one check interval, so events keep being read
+                        changed |= self.bot.process_queue(deadline=now + self.stream['check_interval'])
+                    except (sqlite3.OperationalError, pywikibot.exceptions.Error, requests.RequestException) as e:
+                        # Pending pages are kept and checked again in the next interval
+                        self.bot.sql.rollback()
+                        logger.warning('Checking %d pending pages failed: %s' % (len(pending), e))
+                    finally:
+                        lock.release()
+                last_check = time.monotonic()
+                if changed:
+                    dirty.update(changed)
+                    last_change = now
+                    if first_change is None:
+                        first_change = now
+
+            # Debounce: wait for a quiet period, but never longer than max_delay
+            if dirty and (now - last_change >= self.stream['debounce']
+                          or now - first_change >= self.stream['max_delay']):
+                self.publish(dirty)
+                dirty = set()
+                first_change = last_change = None
+
+    def check_pages(self, pending):
+        """Look up the tracked categories of the pending pages and record the
+        differences from catmembers. Returns the category keys that changed.
+        API and database errors are raised, so the caller can keep the pages."""
+        found = self.bot.api.categories(list(pending), self.cattitles)
+
+        prefix = self.config['category_prefix']
+        now = datetime.now().strftime('%F')
+        changed = set()
+        cur = self.bot.sql.cursor()
+        for title, (pid, ns, categories) in found.items():
+            categories = {c[len(prefix):] for c in categories if c.startswith(prefix)}
+            categories = {c for c in categories if self.namespaces[c] is None or ns in self.namespaces[c]}
+            before = {row[0] for row in cur.execute(
+                'SELECT category FROM catmembers WHERE page_id=? AND category IN (%s)' % ','.join(
+                    '?' for _ in self.catkeys), [pid] + list(self.catkeys))}
+            added = categories - before
+            removed = before - categories
+            if not added and not removed:
+                continue
 
-    import platform
-    pv = platform.python_version()
-    logger.info('running Python %s, setting locale to no_NO' % pv)
+            store_titles(cur, [(pid, title)])
+            for catname in removed:
+                record_removal(cur, now, catname, pid)
+            isnew = self.newpages.is_new(pid) if added else 0
+            for catname in added:
+                record_addition(cur, now, catname, pid, isnew)
+
+            # The edit that changed the categories is at or after the event
+            since = datetime.fromtimestamp(pending[title] - 1, timezone.utc).strftime(API_TIME_FORMAT)
+            for q, cats in (('fikset', removed), ('merket', added)):
+                for k in sorted({self.catkeys[c] for c in cats}):
+                    logger.info('    %s: %s %s' % (title, q, k))
+                    queue_check(cur, pid, k, q, since=since)
+                    changed.add(k)
+        self.bot.sql.commit()
+        cur.close()
+        return changed
 
-    for loc in ['no_NO', 'nb_NO.utf8']:
+    def publish(self, keys):
+        logger.info('Republishing tickers and overview pages for %s' % ', '.join(sorted(keys)))
         try:
-            locale.setlocale(locale.LC_ALL, loc)
-        except locale.Error:
-            logger.warning('Locale %s not found' % loc)
+            self.bot.update_ticker()
+            CatOverview(self.config, self.bot.site, dryrun=self.dryrun, keys=keys)
+        except (pywikibot.exceptions.Error, sqlite3.OperationalError) as e:
+            logger.warning('Publishing failed: %s' % e)
 
-    logger.debug('testing æøå')
 
-    bot = StatBot(dryrun=args.simulate)
+# Columns copied to the yearly archive tables. Archived rows keep the page
+# title next to the page ID, so the archive can be queried on its own
+ARCHIVE_COLUMNS = {
+    'catlog': 'id, date, category, page_id, page, added, new',
+    'cleanlog': 'id, date, category, action, page_id, page, user, revision',
+}
+
+
+def archive_select(table):
+    columns = ', '.join('pages.title AS page' if c == 'page' else '%s.%s' % (table, c)
+                        for c in ARCHIVE_COLUMNS[table].split(', '))
+    return 'SELECT %s FROM main.%s JOIN main.pages ON pages.id = %s.page_id' % (columns, table, table)
+
+
+def archive_columns(sql, table, name):
+    """Return the select list for the archive table `name`, with NULL for the
+    columns it lacks (catlog rows archived before catlog had an id)."""
+    present = {row[1] for row in sql.execute('PRAGMA archive.table_info(%s)' % name)}
+    return ', '.join(c if c in present else 'NULL AS %s' % c for c in ARCHIVE_COLUMNS[table].split(', '))
+
+
+def attach_archive(sql, config):
+    """Attach the archive database as "archive" and create the TEMP views
+    catlog_all and cleanlog_all spanning both the hot and the archived rows."""
+    sql.execute('ATTACH DATABASE ? AS archive', (config['retention']['archive_db'],))
+    for table in ARCHIVE_COLUMNS:
+        parts = [archive_select(table)]
+        for row in sql.execute(
+                'SELECT name FROM archive.sqlite_master WHERE type="table" AND name GLOB ? ORDER BY name',
+                (table + '_[0-9]*', )):
+            parts.append('SELECT %s FROM archive.%s' % (archive_columns(sql, table, row[0]), row[0]))
+        sql.execute('DROP VIEW IF EXISTS temp.%s_all' % table)
+        sql.execute('CREATE TEMP VIEW %s_all AS %s' % (table, ' UNION ALL '.join(parts)))
+
+
+def detach_archive(sql):
+    for table in ARCHIVE_COLUMNS:
+        sql.execute('DROP VIEW IF EXISTS temp.%s_all' % table)
+    sql.execute('DETACH DATABASE archive')
+
+
+def archive_old_rows(sql, config):
+    """Move catlog and cleanlog rows older than the retention period into
+    yearly tables in the archive database, then shrink the hot database.
+
+    The most recent cleanlog row per page, category and action is kept for every page that is
+    still a category member, since CatOverview and backfill depend on it.
+    """
+    retention = config['retention']
+    cutoff = (datetime.now() - timedelta(days=retention['days'])).strftime('%F')
+    logger.info('Archiving catlog and cleanlog rows older than %s' % cutoff)
+
+    keep = '''cleanlog.id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY page_id, category, action ORDER BY date DESC) AS rn
+            FROM cleanlog WHERE page_id IN (SELECT page_id FROM catmembers)
+        ) WHERE rn = 1)'''
+    conditions = {
+        'catlog': 'catlog.date < :cutoff',
+        'cleanlog': 'cleanlog.date < :cutoff AND NOT ' + keep,
+    }
+
+    sql.commit()
+    cur = sql.cursor()
+    cur.execute('ATTACH DATABASE ? AS archive', (retention['archive_db'],))
+    try:
+        for table, columns in ARCHIVE_COLUMNS.items():
+            where = conditions[table]
+            years = [row[0] for row in cur.execute(
+                'SELECT DISTINCT substr(date, 1, 4) FROM main.%s WHERE %s' % (table, where),
+                {'cutoff': cutoff}).fetchall()]
+            for year in years:
+                archive_table = '%s_%s' % (table, year)
+                cur.execute('CREATE TABLE IF NOT EXISTS archive.%s AS %s WHERE 0' % (
+                    archive_table, archive_select(table)))
+                for column in archive_columns(cur, table, archive_table).split(', '):
+                    if column.startswith('NULL AS '):
+                        cur.execute('ALTER TABLE archive.%s ADD COLUMN %s INTEGER' % (archive_table, column[8:]))
+                cur.execute('INSERT INTO archive.%s (%s) %s WHERE %s AND substr(%s.date, 1, 4)=:year' % (
+                    archive_table, columns, archive_select(table), where, table), {'cutoff': cutoff, 'year': year})
+                moved = cur.rowcount
+                cur.execute('DELETE FROM main.%s WHERE %s AND substr(date, 1, 4)=:year' % (table, where),
+                            {'cutoff': cutoff, 'year': year})
+                logger.info('    %s: moved %d rows to archive table %s' % (table, moved, archive_table))
+
+        # Commits the hot and the archive database in one transaction
+        sql.commit()
+    except sqlite3.Error:
+        sql.rollback()
+        raise
+    finally:
+        cur.execute('DETACH DATABASE archive')
+
+    # auto_vacuum can only be switched on by rebuilding the file once
+    if cur.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        logger.info('Enabling incremental vacuum (one-time full VACUUM)')
+        cur.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cur.execute('VACUUM')
+    freed = cur.execute('PRAGMA freelist_count').fetchone()[0]
+    cur.execute('PRAGMA incremental_vacuum(%d)' % retention['vacuum_pages']).fetchall()
+    logger.info('Incremental vacuum released %d of %d free pages' % (
+        freed - cur.execute('PRAGMA freelist_count').fetchone()[0], freed))
+    cur.close()
+
+
+# Tables written by --export: (key column, columns, FROM clause). Rows with a
+# key above the one recorded in the export manifest are new since the last export
+EXPORT_TABLES = {
+    'stats': ('stats.rowid', 'stats.rowid AS rowid, stats.*', 'stats'),
+    'catlog': ('catlog.id', 'catlog.id, catlog.date, catlog.category, catlog.page_id, '
+               'pages.title AS page, catlog.added, catlog.new',
+               'catlog JOIN pages ON pages.id = catlog.page_id'),
+    'cleanlog': ('cleanlog.id', 'cleanlog.id, cleanlog.date, cleanlog.category, cleanlog.action, '
+                 'cleanlog.page_id, pages.title AS page, cleanlog.user, cleanlog.revision',
+                 'cleanlog JOIN pages ON pages.id = cleanlog.page_id'),
+}
+EXPORT_STRING_COLUMNS = {'date', 'category', 'action', 'page', 'user'}
+EXPORT_BATCH_SIZE = 100000
+
+
+def export_tables(config, export_dir, fmt='parquet'):
+    """Append the stats, catlog and cleanlog rows added since the previous export
+    as new Parquet or Arrow IPC files in export_dir/<wiki>/<table>/.
+
+    The database is opened read-only. The first export also includes the rows
+    that have been moved to the archive database.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('--export requires pyarrow, install it with "pip install pyarrow"')
+
+    outdir = os.path.join(export_dir, config['name'])
+    manifest_file = os.path.join(outdir, 'manifest.json')
+    manifest = {'format': fmt, 'tables': {}}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['format'] != fmt:
+            raise RuntimeError('%s was exported as %s, not %s' % (outdir, manifest['format'], fmt))
+
+    sql = sqlite3.connect('file:%s?mode=ro' % config['db'], uri=True, timeout=config['db_timeout'])
+    archive = config['retention'] and os.path.exists(config['retention']['archive_db'])
+    if archive:
+        sql.execute('ATTACH DATABASE ? AS archive', ('file:%s?mode=ro' % config['retention']['archive_db'],))
+
+    logger.info('Exporting %s to %s' % (config['db'], outdir))
+    for table, (key, columns, source) in EXPORT_TABLES.items():
+        state = manifest['tables'].setdefault(table, {'last': 0, 'parts': 0})
+        queries = []
+        if state['parts'] == 0 and archive and table in ARCHIVE_COLUMNS:
+            for row in sql.execute('SELECT name FROM archive.sqlite_master WHERE type="table" AND name GLOB ? '
+                                   'ORDER BY name', (table + '_[0-9]*',)).fetchall():
+                queries.append(('SELECT %s FROM archive.%s' % (archive_columns(sql, table, row[0]), row[0]),
+                                (), False))
+        queries.append(('SELECT %s FROM %s WHERE %s > ? ORDER BY %s' % (columns, source, key, key),
+                        (state['last'],), True))
+
+        os.makedirs(os.path.join(outdir, table), exist_ok=True)
+        for query, params, incremental in queries:
+            cur = sql.execute(query, params)
+            schema = pa.schema([(d[0], pa.string() if d[0] in EXPORT_STRING_COLUMNS else pa.int64())
+                                for d in cur.description])
+            filename = os.path.join(outdir, table, 'part-%05d.%s' % (state['parts'] + 1, fmt))
+            # Files starting with a dot are ignored by pyarrow.dataset until renamed
+            tmpname = os.path.join(outdir, table, '.part.tmp')
+            writer = None
+            count = 0
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)], schema=schema)
+                if writer is None:
+                    if fmt == 'parquet':
+                        writer = pyarrow.parquet.ParquetWriter(tmpname, schema, compression='zstd')
+                    else:
+                        writer = pa.ipc.new_file(tmpname, schema,
+                                                 options=pa.ipc.IpcWriteOptions(compression='zstd'))
+                writer.write_batch(batch)
+                count += len(rows)
+                if incremental:
+                    state['last'] = rows[-1][0]
+            cur.close()
+            if writer is not None:
+                writer.close()
+                os.replace(tmpname, filename)
+                state['parts'] += 1
+                logger.info('    %s: %d rows written to %s' % (table, count, filename))
+
+    sql.close()
+    tmpname = manifest_file + '.tmp'
+    with open(tmpname, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmpname, manifest_file)
+
+
+def run_wiki(config_path, simulate=False, backfill=False):
+    """Run the complete daily job for a single wiki. Returns True on success."""
+    try:
+        config = load_config(config_path)
+        set_log_prefix(config['name'])
+
+        runstart = datetime.now()
+
+        site = pywikibot.Site(config['lang'], config['family'])
+        site.login()
+        limiter = RateLimiter(config['api_delay'])
+
+        # The daemon pauses while the daily run updates the database
+        with DbLock(config['db']):
+            bot = StatBot(config, site, limiter, dryrun=simulate)
+            bot.run()
+
+            if backfill:
+                bot.backfill()
+
+            CatOverview(config, site, dryrun=simulate)
+
+            if config['retention']:
+                archive_old_rows(bot.sql, config)
+
+        runend = datetime.now()
+        runtime = (runend - runstart).total_seconds()
+        logger.info('Runtime was %.f seconds.' % runtime)
+        return True
+
+    except Exception:
+
+        logger.exception('Unhandled Exception')
+        return False
+
 
-    if args.backfill:
-        bot.backfill()
+def run_daemon(config_path, simulate=False):
+    """Follow the recent changes stream for a single wiki until interrupted."""
+    try:
+        config = load_config(config_path)
+        set_log_prefix(config['name'])
+
+        site = pywikibot.Site(config['lang'], config['family'])
+        site.login()
+        limiter = RateLimiter(config['api_delay'])
+
+        bot = StatBot(config, site, limiter, dryrun=simulate)
+        StreamWatcher(bot, dryrun=simulate).run()
+
+    except KeyboardInterrupt:
+        return True
+
+    except Exception:
+
+        logger.exception('Unhandled Exception')
+        return False
+
+
+def _init_worker(verbose):
+    # Worker processes may be spawned rather than forked, so they need
+    # their own logging handlers and locale
+    if not logger.handlers:
+        setup_logging(verbose)
+    setup_locale()
+
+
+def _run_wiki_job(job):
+    return run_wiki(*job)
 
-    CatOverview(dryrun=args.simulate)
 
-    runend = datetime.now()
-    runtime = (runend - runstart).total_seconds()
-    logger.info('Runtime was %.f seconds.' % runtime)
+def _run_daemon_job(job):
+    return run_daemon(*job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CatWatchBot')
+    parser.add_argument('--simulate', action='store_true', help='Do not write results to wiki')
+    parser.add_argument('--verbose', action='store_true', help='Output debug output')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Backfill missing cleanlog dates for seeded pages (slow, run once)')
+    parser.add_argument('--wiki', action='append', metavar='NAME',
+                        help='Only process the wiki configured in wikis/NAME.json (can be repeated). '
+                             'Default: all configured wikis')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of wikis to process in parallel (default: number of CPU cores)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running and follow the recent changes stream instead of the daily run')
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help='Rebuild the leaderboard rollup tables and the tags table from cleanlog and exit')
+    parser.add_argument('--recompute-stats', metavar='YYYY-MM-DD',
+                        help='Recompute the stats for a past day from catlog and exit')
+    parser.add_argument('--export', metavar='DIR',
+                        help='Append new stats, catlog and cleanlog rows to columnar files in DIR/<wiki>/ and exit')
+    parser.add_argument('--export-format', choices=['parquet', 'arrow'], default='parquet',
+                        help='File format for --export (default: parquet)')
+    args = parser.parse_args()
+
+    setup_logging(args.verbose)
+
+    import platform
+    pv = platform.python_version()
+    logger.info('running Python %s, setting locale to no_NO' % pv)
+    setup_locale()
+    logger.debug('testing æøå')
+
+    configs = find_configs(args.wiki)
+    if not configs:
+        logger.error('No wiki configurations found in %s' % WIKIS_DIR)
+        return 1
+
+    if args.export:
+        for path in configs:
+            config = load_config(path)
+            set_log_prefix(config['name'])
+            export_tables(config, args.export, args.export_format)
+        return 0
+
+    if args.recompute_stats:
+        status = 0
+        for path in configs:
+            config = load_config(path)
+            set_log_prefix(config['name'])
+            try:
+                recompute_stats(connect_db(config), config, args.recompute_stats)
+            except ValueError as e:
+                logger.error(str(e))
+                status = 1
+        return status
+
+    if args.rebuild_rollups:
+        for path in configs:
+            config = load_config(path)
+            set_log_prefix(config['name'])
+            sql = connect_db(config)
+            rebuild_rollups(sql, config)
+            rebuild_tags(sql, config)
+        return 0
+
+    if args.daemon:
+        # Every daemon runs until interrupted, so each wiki needs its own process
+        jobs = [(path, args.simulate) for path in configs]
+        job_func = _run_daemon_job
+        workers = len(jobs)
+    else:
+        jobs = [(path, args.simulate, args.backfill) for path in configs]
+        job_func = _run_wiki_job
+        workers = max(1, min(args.workers, len(jobs)))
+    if workers == 1:
+        results = [job_func(job) for job in jobs]
+    else:
+        # Each wiki has its own database and rate limiter, so they can run
+        # in separate processes without sharing any state
+        logger.info('Processing %d wikis using %d worker processes' % (len(jobs), workers))
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(args.verbose,)) as pool:
+            results = pool.map(job_func, jobs, chunksize=1)
 
-except Exception:
+    return 0 if all(results) else 1
 
-    logger.exception('Unhandled Exception')
 
+if __name__ == '__main__':
+    sys.exit(main())
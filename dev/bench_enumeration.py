@@ -0,0 +1,72 @@
+"""Time the category enumeration of the daily run against dev/fakewiki.py.
+
+The categories of the wiki config get synthetic sizes, the largest taking
+20 requests, and every API response is delayed by --latency seconds. The
+rate limiter uses the config's api_delay, and the pool its
+enumeration_workers, so the shipped settings are measured by default:
+
+    python dev/bench_enumeration.py --config wikis/no.json --latency 0.2
+
+"Limited" repeats the run with every request waiting for the rate limiter,
+as each categorymembers continuation did before enumeration skipped it.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from catwatchbot import MwApi, RateLimiter, load_config  # noqa: E402
+from fakewiki import FakeWiki  # noqa: E402
+
+SIZES = [10000, 4000, 3000, 2000, 1500, 1000, 800, 500, 300, 200, 100]
+
+
+class LimitedApi(MwApi):
+
+    def request(self, wait=True, **params):
+        return super().request(True, **params)
+
+
+def enumerate_all(api, catnames, workers):
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        members = list(pool.map(lambda catname: dict(api.category_members(catname)), catnames))
+    return time.monotonic() - start, sum(len(m) for m in members)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time category enumeration against a local stand-in')
+    parser.add_argument('--config', default='wikis/no.json')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds before each API response')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    catnames = [config['category_prefix'] + catname for k in config['cats']
+                for catname in config['cats'][k]['categories']]
+    wiki = FakeWiki(args.latency)
+    pid = 0
+    for catname, size in zip(catnames, SIZES * (len(catnames) // len(SIZES) + 1)):
+        for _ in range(size):
+            pid += 1
+            wiki.add_page(pid, 'Side %d' % pid, categories=[catname])
+    server, api_url, stream_url = wiki.serve()
+
+    print('%s: %d categories, %d members, latency %.2f s, api_delay %.1f s, enumeration_workers %d' % (
+        args.config, len(catnames), pid, args.latency, config['api_delay'], config['enumeration_workers']))
+    for label, cls, workers in [('1 worker', MwApi, 1),
+                                ('%d workers' % config['enumeration_workers'], MwApi,
+                                 config['enumeration_workers']),
+                                ('1 worker, limited', LimitedApi, 1),
+                                ('%d workers, limited' % config['enumeration_workers'], LimitedApi,
+                                 config['enumeration_workers'])]:
+        api = cls(None, RateLimiter(config['api_delay']), endpoint=api_url)
+        del wiki.requests[:]
+        elapsed, found = enumerate_all(api, catnames, workers)
+        print('    %-22s %6.1f s  (%d requests, %d members)' % (label, elapsed, len(wiki.requests), found))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Exercise the bot's API code against dev/fakewiki.py, without a wiki.
+
+    python dev/check_api.py
+
+Runs StatBot.preflight and the batched page queue, the pairing of
+removals and additions through the move log in CatWatcher, NewPages and
+read_event_stream, and fails with an AssertionError if any of them does
+not behave as expected. The database is a temporary file.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import catwatchbot as cw  # noqa: E402
+from fakewiki import FakeWiki  # noqa: E402
+
+
+class Category:
+    """The part of pywikibot.Category that CatWatcher uses."""
+
+    def __init__(self, title):
+        self._title = title
+
+    def title(self, with_ns=True):
+        return self._title
+
+
+def make_bot(wiki, tmpdir):
+    server, api_url, stream_url = wiki.serve()
+    config = cw.load_config(os.path.join(cw.WIKIS_DIR, 'no.json'))
+    config['db'] = os.path.join(tmpdir, 'check.db')
+    config['api_endpoint'] = api_url
+    return cw.StatBot(config, None, cw.RateLimiter(0), dryrun=True), stream_url
+
+
+def check_preflight(bot, wiki):
+    # 1195 stored pages: every 10th deleted, every 7th a redirect, every 5th renamed
+    cur = bot.sql.cursor()
+    pages = []
+    for pid in range(1, 1196):
+        title = 'Side %d' % pid
+        pages.append((pid, title))
+        cur.execute('INSERT INTO pages (id, title) VALUES (?,?)', (pid, title))
+        if pid % 10 == 0:
+            continue
+        wiki.add_page(pid, 'Ny side %d' % pid if pid % 5 == 0 else title, redirect=pid % 7 == 0)
+    bot.sql.commit()
+
+    del wiki.requests[:]
+    live = bot.preflight(pages)
+    bot.sql.commit()
+    expected = {pid for pid in range(1, 1196) if pid % 10 and pid % 7}
+    assert set(live) == expected, set(live) ^ expected
+    assert len(wiki.requests) == 3, len(wiki.requests)
+    assert live[5]['title'] == 'Ny side 5' and live[5]['lastrevid'] == 50
+    assert bot.sql.execute('SELECT title FROM pages WHERE id=5').fetchone()[0] == 'Ny side 5'
+    renamed = bot.sql.execute('SELECT COUNT(*) FROM moves').fetchone()[0]
+    assert renamed == len([pid for pid in expected if pid % 5 == 0]), renamed
+    print('preflight: %d pages, %d live, %d renamed, API requests: %d' % (
+        len(pages), len(live), renamed, len(wiki.requests)))
+
+
+def check_queue(bot, wiki):
+    # Only the batches that fit in the check budget are looked up
+    cur = bot.sql.cursor()
+    for pid in range(1, 121):
+        cw.queue_check(cur, pid, 'opprydning', 'merket')
+    cur.execute("UPDATE pagequeue SET next_attempt='2000-01-01T00:00:00Z'")
+    bot.sql.commit()
+
+    checked = []
+    bot.check_page = lambda pid, p, q, k, templates, since=None, lastrevid=None: checked.append((pid, p, lastrevid))
+    del wiki.requests[:]
+    bot.process_queue(max_checks=10)
+    del bot.check_page
+    assert len(checked) == 10, checked
+    assert len(wiki.requests) == 1, len(wiki.requests)
+    assert (5, 'Ny side 5', 50) in checked, checked
+    left = bot.sql.execute('SELECT COUNT(*) FROM pagequeue').fetchone()[0]
+    print('process_queue: %d checks, %d left in the queue, API requests: %d' % (
+        len(checked), left, len(wiki.requests)))
+    bot.sql.execute('DELETE FROM pagequeue')
+    bot.sql.commit()
+
+
+def check_movelog(bot, wiki):
+    # A page moved twice and recreated with a new ID, and a page that was removed
+    cat = 'Kategori:Opprydning-statistikk'
+    cur = bot.sql.cursor()
+    for pid, title in [(2001, 'Bergen (by)'), (2002, 'Stavanger')]:
+        cur.execute('INSERT INTO pages (id, title) VALUES (?,?)', (pid, title))
+        cur.execute('INSERT INTO catmembers (date, category, page_id) VALUES (?,?,?)',
+                    ('2024-05-01', cat[len('Kategori:'):], pid))
+    cur.execute('INSERT INTO catlog (date, category, page_id, added, new) VALUES (?,?,?,1,0)',
+                ('2024-05-01', cat[len('Kategori:'):], 2001))
+    bot.sql.commit()
+    now = datetime.now(timezone.utc)
+    wiki.add_page(2003, 'Bergen', categories=[cat])
+    wiki.moves.append(((now - timedelta(hours=2)).strftime(cw.API_TIME_FORMAT), 'Bergen (by)', 'Bergen kommune'))
+    wiki.moves.append(((now - timedelta(hours=1)).strftime(cw.API_TIME_FORMAT), 'Bergen kommune', 'Bergen'))
+
+    since = (now - timedelta(days=1)).strftime(cw.API_TIME_FORMAT)
+    members = dict(bot.api.category_members(cat))
+    watcher = cw.CatWatcher(bot.sql, Category(cat[len('Kategori:'):]), members, cw.NewPages(bot.api),
+                            movelog=cw.MoveLog(bot.api, since))
+    assert watcher.removals == [(2002, 'Stavanger')], watcher.removals
+    assert watcher.additions == [], watcher.additions
+    assert watcher.renames == [(2003, 'Bergen (by)', 'Bergen')], watcher.renames
+    history = bot.sql.execute('SELECT COUNT(*) FROM catlog WHERE page_id=2003').fetchone()[0]
+    assert history == 1 and not bot.sql.execute('SELECT 1 FROM pages WHERE id=2001').fetchone()
+    print('MoveLog: %s paired with %s through 2 moves, history moved to page %d' % (
+        'Bergen (by)', 'Bergen', 2003))
+
+
+def check_newpages(bot, wiki):
+    now = datetime.now(timezone.utc)
+    wiki.add_page(3001, 'Ny artikkel', created=(now - timedelta(days=2)).strftime(cw.API_TIME_FORMAT))
+    wiki.add_page(3002, 'Gammel artikkel', created=(now - timedelta(days=30)).strftime(cw.API_TIME_FORMAT))
+    newpages = cw.NewPages(bot.api)
+    del wiki.requests[:]
+    assert [newpages.is_new(pid) for pid in (3001, 3002, 1)] == [1, 0, 0]
+    assert len(wiki.requests) == 1, len(wiki.requests)
+    print('NewPages: 3 lookups, API requests: %d' % len(wiki.requests))
+
+
+def check_event_stream(wiki, stream_url):
+    for n in range(3):
+        wiki.add_event({'wiki': 'nowiki', 'type': 'edit', 'title': 'Side %d' % n, 'timestamp': 1715680800 + n})
+    events = list(cw.read_event_stream(stream_url))
+    assert [event_id for event_id, data in events] == ['1', '2', '3'], events
+    assert '"Side 1"' in events[1][1]
+    resumed = list(cw.read_event_stream(stream_url, last_event_id='2'))
+    assert [event_id for event_id, data in resumed] == ['3'], resumed
+    print('read_event_stream: %d events, %d after Last-Event-ID 2' % (len(events), len(resumed)))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        wiki = FakeWiki()
+        bot, stream_url = make_bot(wiki, tmpdir)
+        check_preflight(bot, wiki)
+        check_queue(bot, wiki)
+        check_movelog(bot, wiki)
+        check_newpages(bot, wiki)
+        check_event_stream(wiki, stream_url)
+        bot.sql.close()
+    print('All checks passed')
+
+
+if __name__ == '__main__':
+    main()
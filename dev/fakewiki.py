@@ -0,0 +1,207 @@
+"""Local stand-in for the MediaWiki API and the recent changes stream.
+
+It answers the queries MwApi sends (categorymembers, info, categories, the
+move log and new pages in the recent changes) from an in-memory wiki, and serves the recent changes as
+server-sent events. Used by the scripts in this directory:
+
+    python dev/fakewiki.py --latency 0.2
+
+serves a small example wiki until interrupted. Point MwApi at the printed
+URL with "api_endpoint" in a wiki config.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+# Largest cmlimit/lelimit for "max" without the apihighlimits right
+LIMIT = 500
+
+
+class FakeWiki:
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.pages = {}
+        self.members = {}
+        self.moves = []
+        self.events = []
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def add_page(self, pid, title, ns=0, categories=(), lastrevid=None, redirect=False,
+                 created='2020-01-01T00:00:00Z'):
+        self.pages[pid] = {'pageid': pid, 'ns': ns, 'title': title, 'created': created,
+                           'lastrevid': lastrevid or pid * 10, 'redirect': redirect}
+        for cat in categories:
+            self.members.setdefault(cat, []).append(pid)
+
+    def move_page(self, timestamp, old, new):
+        """Rename a page, keeping its ID, and log the move."""
+        for page in self.pages.values():
+            if page['title'] == old:
+                page['title'] = new
+        self.moves.append((timestamp, old, new))
+
+    def add_event(self, event):
+        self.events.append((str(len(self.events) + 1), event))
+
+    def by_title(self, title):
+        for page in self.pages.values():
+            if page['title'] == title:
+                return page
+
+    def query(self, params):
+        with self._lock:
+            self.requests.append(params)
+        if params.get('list') == 'categorymembers':
+            return self.categorymembers(params)
+        if params.get('list') == 'logevents':
+            return self.logevents(params)
+        if params.get('list') == 'recentchanges':
+            return self.recentchanges(params)
+        if 'pageids' in params:
+            return self.info(params)
+        if 'titles' in params:
+            return self.titles(params)
+        return {'error': {'code': 'badvalue', 'info': 'Not supported by the stand-in: %s' % params}}
+
+    @staticmethod
+    def limit(params, key):
+        return LIMIT if params.get(key, 'max') == 'max' else int(params[key])
+
+    @staticmethod
+    def page_slice(items, params, key, limit):
+        """Return one batch of items and the continuation, if any."""
+        offset = int(params.get(key, 0))
+        data = {'query': {}}
+        if offset + limit < len(items):
+            data['continue'] = {key: str(offset + limit), 'continue': '-||'}
+        return items[offset:offset + limit], data
+
+    def categorymembers(self, params):
+        namespaces = None
+        if 'cmnamespace' in params:
+            namespaces = {int(ns) for ns in params['cmnamespace'].split('|')}
+        pages = [self.pages[pid] for pid in self.members.get(params['cmtitle'], [])]
+        pages = [p for p in pages if namespaces is None or p['ns'] in namespaces]
+        batch, data = self.page_slice(pages, params, 'cmcontinue', self.limit(params, 'cmlimit'))
+        data['query']['categorymembers'] = [{'pageid': p['pageid'], 'ns': p['ns'], 'title': p['title']}
+                                            for p in batch]
+        return data
+
+    def info(self, params):
+        pages = []
+        for pid in params['pageids'].split('|'):
+            page = self.pages.get(int(pid))
+            if page is None:
+                pages.append({'pageid': int(pid), 'missing': True})
+                continue
+            info = {'pageid': page['pageid'], 'ns': page['ns'], 'title': page['title'],
+                    'lastrevid': page['lastrevid']}
+            if page['redirect']:
+                info['redirect'] = True
+            pages.append(info)
+        return {'query': {'pages': pages}}
+
+    def titles(self, params):
+        categories = None
+        if params.get('prop') == 'categories':
+            categories = set(params.get('clcategories', '').split('|'))
+        pages = []
+        for title in params['titles'].split('|'):
+            page = self.by_title(title)
+            if page is None:
+                pages.append({'ns': 0, 'title': title, 'missing': True})
+                continue
+            result = {'pageid': page['pageid'], 'ns': page['ns'], 'title': page['title']}
+            if categories is not None:
+                result['categories'] = [{'ns': 14, 'title': cat} for cat in sorted(categories)
+                                        if page['pageid'] in self.members.get(cat, [])]
+            pages.append(result)
+        return {'query': {'pages': pages}}
+
+    def logevents(self, params):
+        moves = [m for m in sorted(self.moves) if params['lestart'] <= m[0] <= params['leend']]
+        batch, data = self.page_slice(moves, params, 'lecontinue', self.limit(params, 'lelimit'))
+        data['query']['logevents'] = [{'type': 'move', 'timestamp': ts, 'title': old,
+                                       'params': {'target_title': new}} for ts, old, new in batch]
+        return data
+
+    def recentchanges(self, params):
+        pages = sorted((p for p in self.pages.values() if params['rcstart'] <= p['created'] <= params['rcend']),
+                       key=lambda p: p['created'])
+        batch, data = self.page_slice(pages, params, 'rccontinue', self.limit(params, 'rclimit'))
+        data['query']['recentchanges'] = [{'type': 'new', 'ns': p['ns'], 'title': p['title'],
+                                           'pageid': p['pageid'], 'revid': p['pageid'] * 10, 'old_revid': 0,
+                                           'timestamp': p['created']} for p in batch]
+        return data
+
+    def serve(self, port=0):
+        """Serve the wiki in a background thread. Returns (server, API URL, stream URL)."""
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/w/api.php':
+                    time.sleep(wiki.latency)
+                    self.send_body('application/json', json.dumps(wiki.query(dict(parse_qsl(url.query)))))
+                elif url.path == '/v2/stream/recentchange':
+                    self.send_stream(self.headers.get('Last-Event-ID'))
+                else:
+                    self.send_error(404)
+
+            def send_body(self, content_type, body):
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_stream(self, last_event_id):
+                # Like EventStreams: a comment first, then id/data messages.
+                # Events up to Last-Event-ID are not sent again
+                ids = [event_id for event_id, event in wiki.events]
+                start = ids.index(last_event_id) + 1 if last_event_id in ids else 0
+                lines = [':ok', '']
+                for event_id, event in wiki.events[start:]:
+                    lines += ['event: message', 'id: %s' % event_id, 'data: %s' % json.dumps(event), '']
+                self.send_body('text/event-stream; charset=utf-8', '\n'.join(lines) + '\n')
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = 'http://127.0.0.1:%d' % server.server_address[1]
+        return server, base + '/w/api.php', base + '/v2/stream/recentchange'
+
+
+def example_wiki(latency=0.0):
+    wiki = FakeWiki(latency)
+    wiki.add_page(1, 'Oslo', categories=['Kategori:Opprydning-statistikk'])
+    wiki.add_page(2, 'Bergen', categories=['Kategori:Opprydning-statistikk'])
+    wiki.add_page(3, 'Trondhjem', redirect=True)
+    wiki.add_page(4, 'Diskusjon:Oslo', ns=1, categories=['Kategori:Opprydning-statistikk'])
+    wiki.move_page('2024-05-14T10:00:00Z', 'Bergen (by)', 'Bergen')
+    wiki.add_event({'wiki': 'nowiki', 'type': 'edit', 'title': 'Oslo', 'timestamp': 1715680800})
+    return wiki
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a small example wiki')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each API response')
+    args = parser.parse_args()
+    server, api_url, stream_url = example_wiki(args.latency).serve(args.port)
+    print('API: %s\nStream: %s' % (api_url, stream_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
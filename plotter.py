@@ -4,11 +4,13 @@
 Generate SVG plots showing the time development of maintenance categories
 for the Norwegian Wikipedia "Vedlikehold og oppussing" project.
 
-Reads from the vedlikehold.db SQLite database (stats table) and produces
-one SVG per category, matching the naming convention expected by uploadplot.py:
+Reads from the vedlikehold.db SQLite database (stats table), or from the
+files written by "catwatchbot.py --export", and produces one SVG per category,
+matching the naming convention expected by uploadplot.py:
   "nowp vedlikeholdsutvikling - {category}.svg"
 """
 import os
+import json
 import sqlite3
 import argparse
 from datetime import datetime
@@ -48,15 +50,29 @@ DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vedlikehold.
 CHART_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'charts')
 
 
-def fetch_data(catkey):
+def fetch_export_rows(export_dir, catkey):
+    """Fetch date and count for a category from an exported stats dataset."""
+    import pyarrow.dataset
+
+    with open(os.path.join(export_dir, 'manifest.json'), encoding='utf-8') as f:
+        fmt = {'parquet': 'parquet', 'arrow': 'ipc'}[json.load(f)['format']]
+    table = pyarrow.dataset.dataset(os.path.join(export_dir, 'stats'), format=fmt) \
+        .to_table(columns=['date', catkey]).sort_by('date')
+    return list(zip(table.column('date').to_pylist(), table.column(catkey).to_pylist()))
+
+
+def fetch_data(catkey, export_dir=None):
     """Fetch date and count for a category from the stats table."""
-    sql = sqlite3.connect(DB_PATH)
-    cur = sql.cursor()
-    rows = cur.execute(
-        'SELECT date, %s FROM stats ORDER BY date ASC' % catkey
-    ).fetchall()
-    cur.close()
-    sql.close()
+    if export_dir:
+        rows = fetch_export_rows(export_dir, catkey)
+    else:
+        sql = sqlite3.connect(DB_PATH)
+        cur = sql.cursor()
+        rows = cur.execute(
+            'SELECT date, %s FROM stats ORDER BY date ASC' % catkey
+        ).fetchall()
+        cur.close()
+        sql.close()
 
     dates = []
     counts = []
@@ -71,9 +87,9 @@ def fetch_data(catkey):
     return dates, counts
 
 
-def plot_category(catkey):
+def plot_category(catkey, export_dir=None):
     """Generate an SVG plot for a single category."""
-    dates, counts = fetch_data(catkey)
+    dates, counts = fetch_data(catkey, export_dir)
 
     if not dates:
         print('  No data for %s, skipping' % catkey)
@@ -169,16 +185,20 @@ def main():
     parser = argparse.ArgumentParser(description='Generate maintenance category plots')
     parser.add_argument('--upload', action='store_true',
                         help='Upload generated SVGs to Wikimedia Commons')
+    parser.add_argument('--export', metavar='DIR',
+                        help='Read from the export written by "catwatchbot.py --export", e.g. export/no, '
+                             'instead of the database')
     args = parser.parse_args()
 
-    print('Generating plots from %s' % DB_PATH)
+    source = args.export or DB_PATH
+    print('Generating plots from %s' % source)
 
-    if not os.path.exists(DB_PATH):
-        print('Error: Database not found at %s' % DB_PATH)
+    if not os.path.exists(source):
+        print('Error: %s not found' % source)
         return
 
     for catkey in CATEGORIES:
-        plot_category(catkey)
+        plot_category(catkey, args.export)
 
     if args.upload:
         print('Uploading to Wikimedia Commons...')
@@ -14,9 +14,9 @@ except ImportError:
 family = 'wikipedia'
 mylang = 'no'
 
-# Bot username on Norwegian Wikipedia and Commons
+# Bot username on all Wikipedias configured in wikis/ and Commons
 # Set MW_BOT_USERNAME in .env, or change the default below
-usernames['wikipedia']['no'] = os.getenv('MW_BOT_USERNAME', 'IngeniousBot')
+usernames['wikipedia']['*'] = os.getenv('MW_BOT_USERNAME', 'IngeniousBot')
 usernames['commons']['commons'] = os.getenv('MW_BOT_USERNAME', 'IngeniousBot')
 
 # OAuth 1.0a authentication
@@ -27,7 +27,7 @@ _access_token = os.getenv('MW_ACCESS_TOKEN', '')
 _access_secret = os.getenv('MW_ACCESS_SECRET', '')
 
 if _consumer_token and _consumer_secret and _access_token and _access_secret:
-    authenticate['no.wikipedia.org'] = (
+    authenticate['*.wikipedia.org'] = (
         _consumer_token,
         _consumer_secret,
         _access_token,
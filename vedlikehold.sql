@@ -1,16 +1,26 @@
+-- Create table for pages, keyed by MediaWiki page ID. Pages that were
+-- already deleted when the database was migrated have negative IDs
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS pages_title ON pages (title);
+
 -- Create table for category members
 CREATE TABLE IF NOT EXISTS catmembers (
     date DATETIME NOT NULL,
     category TEXT NOT NULL,
-    page TEXT NOT NULL,
-    PRIMARY KEY (category, page)
-);
+    page_id INTEGER NOT NULL REFERENCES pages (id),
+    PRIMARY KEY (category, page_id)
+) WITHOUT ROWID;
 
 -- Create table for category log
 CREATE TABLE IF NOT EXISTS catlog (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     date DATETIME NOT NULL,
     category TEXT NOT NULL,
-    page TEXT NOT NULL,
+    page_id INTEGER NOT NULL REFERENCES pages (id),
     added INTEGER NOT NULL,
     new INTEGER NOT NULL
 );
@@ -29,13 +39,101 @@ CREATE TABLE IF NOT EXISTS stats (
     ukategorisert INTEGER NOT NULL
 );
 
+-- Create table for the daily member count of each category, written
+-- next to the stats row when category_stats is enabled in the wiki config
+CREATE TABLE IF NOT EXISTS catstats (
+    date DATETIME NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (date, category)
+) WITHOUT ROWID;
+
 -- Create table for clean log
 CREATE TABLE IF NOT EXISTS cleanlog (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     date DATETIME NOT NULL,
     category TEXT NOT NULL,
     action TEXT NOT NULL,
-    page TEXT NOT NULL,
+    page_id INTEGER NOT NULL REFERENCES pages (id),
     user TEXT NOT NULL,
     revision INTEGER NOT NULL
-);
\ No newline at end of file
+);
+
+CREATE INDEX IF NOT EXISTS cleanlog_page ON cleanlog (page_id, category, action, date);
+
+-- Archived catlog rows used to be summed into catlog_rollup, which nothing
+-- read. The rows themselves are kept in the archive database
+DROP TABLE IF EXISTS catlog_rollup;
+
+-- Create table for page renames detected between runs
+CREATE TABLE IF NOT EXISTS moves (
+    date DATETIME NOT NULL,
+    page_id INTEGER NOT NULL REFERENCES pages (id),
+    old_title TEXT NOT NULL,
+    new_title TEXT NOT NULL
+);
+
+-- Create table for bot runs (UTC timestamps)
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started DATETIME NOT NULL,
+    finished DATETIME
+);
+
+-- Create table for tagging intervals, one row from a page being tagged
+-- (merket) until the tag is removed (fikset). Maintained with every cleanlog
+-- insert. tagged is NULL if the tagging was never seen, fixed is NULL while
+-- the page is still tagged
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    page_id INTEGER NOT NULL REFERENCES pages (id),
+    category TEXT NOT NULL,
+    tagged DATETIME,
+    tagged_revision INTEGER,
+    tagged_user TEXT,
+    fixed DATETIME,
+    fixed_revision INTEGER,
+    fixed_user TEXT,
+    fix_days REAL
+);
+
+CREATE INDEX IF NOT EXISTS tags_page ON tags (page_id, category, tagged);
+CREATE INDEX IF NOT EXISTS tags_open ON tags (category, fixed, tagged);
+CREATE INDEX IF NOT EXISTS tags_fix_days ON tags (category, fix_days);
+
+-- Create tables for the leaderboards: fikset/merket events per month,
+-- category key and user, and per month and category key. Maintained with
+-- every cleanlog insert
+CREATE TABLE IF NOT EXISTS usermonth (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    action TEXT NOT NULL,
+    user TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (month, category, action, user)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthtotals (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    action TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (month, category, action)
+) WITHOUT ROWID;
+-- Create table for page checks (looking up the revision where a template was
+-- inserted or removed) that are waiting to be done. Checks that fail are
+-- retried at next_attempt (UTC), and checks left over when a run's budget is
+-- used up are done in the next run
+CREATE TABLE IF NOT EXISTS pagequeue (
+    page_id INTEGER NOT NULL REFERENCES pages (id),
+    category TEXT NOT NULL,
+    action TEXT NOT NULL,
+    since DATETIME,
+    queued DATETIME NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt DATETIME NOT NULL,
+    last_error TEXT,
+    PRIMARY KEY (page_id, category, action)
+);
+
+CREATE INDEX IF NOT EXISTS pagequeue_due ON pagequeue (next_attempt);